@@ -1,4 +1,9 @@
 import sys
+import weakref
+import traceback
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, CancelledError
 from io import BytesIO, StringIO
 from io import TextIOWrapper
 from datetime import timedelta
@@ -22,6 +27,52 @@ from bokeh.io.export import get_layout_html
 
 from lib import *
 
+# a pan draws at most one frame per display refresh
+PAN_FRAME_MS = 16
+# zoom/pan history entries kept for back/next, the first one is kept for reset
+LIM_HISTORY_SIZE = 100
+
+# calc runs of all pages share one process pool, and the columns of every
+# loaded Data are copied to shared memory once for all of them. the blocks are
+# keyed by the Data itself, so a new Data never gets the block of a closed one
+_calc_executor = None
+_shared_datas = weakref.WeakKeyDictionary()
+
+
+def calcExecutor():
+    global _calc_executor
+    if _calc_executor is None:
+        # spawn, not fork: the GUI process has Qt threads running
+        _calc_executor = ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"))
+    return _calc_executor
+
+
+def sharedData(data):
+    shared = _shared_datas.get(data)
+    if shared is None:
+        arrays = {name: data.get_col(name).to_numpy() for name in CALC_COLUMNS}
+        shared = SharedArrays(arrays)
+        _shared_datas[data] = shared
+        # a Data dropped without releaseSharedData still frees its block
+        weakref.finalize(data, shared.close)
+    return shared.spec
+
+
+def releaseSharedData(data):
+    shared = _shared_datas.pop(data, None)
+    if shared is not None:
+        shared.close()
+
+
+def closeCalc():
+    global _calc_executor
+    if _calc_executor is not None:
+        _calc_executor.shutdown(wait=False, cancel_futures=True)
+        _calc_executor = None
+    for shared in list(_shared_datas.values()):
+        shared.close()
+    _shared_datas.clear()
+
 class LogSignal(QObject):
     signal_str = pyqtSignal(str)
     def __init__(self):
@@ -86,6 +137,60 @@ class Worker(QRunnable):
             self.signals.finished.emit()
 
 
+class CalcWorker(QRunnable):
+    # one calc run of a page. the fit and score stages run one after another
+    # in the process pool, so progress is reported per stage and a cancelled
+    # run stops between them. the thread only waits; the page applies the
+    # result on the GUI thread
+    def __init__(self, spec, part, option, sizes, model=None):
+        super().__init__()
+        self.spec = spec
+        self.part = part
+        self.option = option
+        self.sizes = sizes
+        self.model = model
+        self.signals = WorkerSignals()
+        self.cancelled = False
+        self.future = None
+
+    def cancel(self):
+        self.cancelled = True
+        future = self.future
+        if future is not None:
+            future.cancel()
+
+    def stage(self, fn, *args):
+        self.future = calcExecutor().submit(fn, *args)
+        if self.cancelled:
+            self.future.cancel()
+        return self.future.result()
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            self.signals.progress.emit(0)
+            model = self.model
+            if model is None:
+                step_size, window_size = self.sizes
+                model = self.stage(calc_fit, self.spec, self.part, self.option["bg_time_init"], self.option["bg_time_end"], step_size, window_size)
+            if self.cancelled:
+                return
+            self.signals.progress.emit(50)
+            result = self.stage(calc_score, self.spec, self.part, model, self.option)
+            if self.cancelled:
+                return
+            self.signals.progress.emit(100)
+            self.signals.result.emit((self, model, result))
+        except CancelledError:
+            pass
+        except:
+            traceback.print_exc()
+            exctype, value = sys.exc_info()[:2]
+            self.signals.error.emit((exctype, value, traceback.format_exc()))
+        finally:
+            self.signals.finished.emit()
+
+
 class InputForm(QHBoxLayout):
     def __init__(self, name, form_type):
         self.label = QLabel(name)
@@ -181,8 +286,15 @@ class CalcOptionEditWidget(QWidget):
         layout.addWidget(self.resetButton)
         self.edit_layout.addLayout(layout)
 
+        self.progressBar = QProgressBar()
+        self.progressBar.setRange(0, 100)
+        self.edit_layout.addWidget(self.progressBar)
+
         self.setLayout(self.edit_layout)
 
+    def setProgress(self, value):
+        self.progressBar.setValue(value)
+
     def callCalc(self):
         print(self.option_value)
         self.calcSignal.emit(self.option_value)
@@ -215,6 +327,11 @@ class GraphViewWidget(FigureCanvas):
         FigureCanvas.updateGeometry(self)
 
         self.artists = []
+        self.series = {}
+        self.background = None
+        # connected before the zoom selector, whose background then includes
+        # the series
+        self.draw_event = self.mpl_connect("draw_event", self.on_draw)
 
         self.setTitle(title)
         self.initEventCallBack()
@@ -276,7 +393,7 @@ class GraphViewWidget(FigureCanvas):
     def updateCanvas(self):
         self.clear()
 
-    def plot(self, x, y, label=None, twinx=False):
+    def plot(self, x, y, label=None, twinx=False, pyramid=None):
         if twinx:
             if self.twinx is None:
                 self.twinx = self.axes.twinx()
@@ -286,18 +403,120 @@ class GraphViewWidget(FigureCanvas):
         else:
             ax = self.axes
 
+        x, y = self.visiblePoints(x, y, pyramid=pyramid)
         line = ax.plot(x, y, label=label)
         if label:
             line[0].set_label(label)
             self.axes.legend()
         self.artists.append(line)
+        return line[0]
 
     def scatter(self, x, y, label=None, twinx=False):
+        x, y = self.visiblePoints(x, y, scatter=True)
         scatter = self.axes.scatter(x, y,  s=0.4)
         if label:
             scatter.set_label(label)
             self.axes.legend()
         self.artists.append(scatter)
+        return scatter
+
+    def visiblePoints(self, x, y, scatter=False, pyramid=None):
+        # the points of a series worth drawing at the current limits
+        if pyramid is not None:
+            # only the visible range, read from the level matching the width
+            index = pyramid.query(*self.visibleXRange(x), buckets=self.decimationBuckets())
+            return np.asarray(x)[index], np.asarray(y)[index]
+        if not scatter:
+            return decimate(x, y, self.decimationBuckets())
+
+        x = np.asarray(x)
+        y = np.asarray(y)
+        visible = np.ones(x.size, dtype=bool)
+        if not self.axes.get_autoscalex_on():
+            lo, hi = self.visibleXRange(x)
+            visible &= (as_numeric(x) >= lo) & (as_numeric(x) <= hi)
+        if not self.axes.get_autoscaley_on():
+            lo, hi = self.axes.get_ylim()
+            visible &= (y >= lo) & (y <= hi)
+        height = self.decimationBuckets(self.axes.get_window_extent().height)
+        return decimate(x[visible], y[visible], self.decimationBuckets(), scatter=True, height=height)
+
+    def addSeries(self, key, x, y, label=None, twinx=False, scatter=False, pyramid=None):
+        # one persistent artist per series until clear(). the artists are
+        # animated, so the cached background holds only axes, ticks and legend
+        # and they are blitted on top of it. returns True when the background
+        # changed: a legend entry was added or the axes autoscale to it
+        if scatter:
+            artist = self.scatter(x, y, label=label, twinx=twinx)
+        else:
+            artist = self.plot(x, y, label=label, twinx=twinx, pyramid=pyramid)
+        artist.set_animated(True)
+        self.series[key] = (artist, x, y, scatter, pyramid)
+        ax = artist.axes
+        if ax is not self.axes:
+            # the twin axis follows its series in y only, its ticks are part
+            # of the background
+            self.rescaleTwin(ax)
+            return True
+        return bool(label) or ax.get_autoscalex_on() or ax.get_autoscaley_on()
+
+    def rescaleTwin(self, ax):
+        ax.relim()
+        ax.autoscale_view(scalex=False)
+
+    def refreshSeries(self):
+        # points of every series again for new limits, without new artists.
+        # the twin axis is rescaled to its new points, so the caller draws
+        # the background again
+        for artist, x, y, scatter, pyramid in self.series.values():
+            x, y = self.visiblePoints(x, y, scatter=scatter, pyramid=pyramid)
+            if scatter:
+                artist.set_offsets(np.column_stack([artist.axes.convert_xunits(x), artist.axes.convert_yunits(y)]))
+            else:
+                artist.set_data(x, y)
+        if self.twinx is not None:
+            self.rescaleTwin(self.twinx)
+
+    def drawSeries(self):
+        # twin axes are below the main axes, the legend stays on top
+        for artist, _, _, _, _ in sorted(self.series.values(), key=lambda s: s[0].axes.get_zorder()):
+            self.fig.draw_artist(artist)
+        legend = self.axes.get_legend()
+        if legend is not None:
+            self.fig.draw_artist(legend)
+
+    def render(self, full=False):
+        # a full draw renders the background and caches it in on_draw. else
+        # the cached background is restored and only the series are drawn
+        if full or self.background is None:
+            self.draw()
+            return
+        self.restore_region(self.background)
+        self.drawSeries()
+        self.blit(self.fig.bbox)
+
+    def on_draw(self, event):
+        self.background = self.copy_from_bbox(self.fig.bbox)
+        self.drawSeries()
+
+    def decimationBuckets(self, pixels=None):
+        # series are cut down to two points per pixel of the axes before they
+        # reach matplotlib, so drawing cost does not grow with the recording
+        if pixels is None:
+            pixels = self.axes.get_window_extent().width
+        if pixels < 1:
+            return DECIMATE_BUCKETS
+        return int(pixels) * 2
+
+    def visibleXRange(self, x):
+        # xlim in the units of as_numeric(x), everything while the x axis
+        # still autoscales
+        if self.axes.get_autoscalex_on():
+            return -np.inf, np.inf
+        lo, hi = self.axes.get_xlim()
+        if np.asarray(x).dtype.kind == "M":
+            lo, hi = (pd.Timestamp(matplotlib.dates.num2date(v)).value for v in (lo, hi))
+        return lo, hi
 
     def getXlim(self):
         return self.axes.get_xlim()
@@ -313,7 +532,11 @@ class GraphViewWidget(FigureCanvas):
 
     def clear(self):
         self.artists = []
+        self.series = {}
+        self.background = None
         self.axes.clear()
+        if self.twinx is not None:
+            self.twinx.clear()
 
     def setTitle(self, title):
         self.axes.set_title(title)
@@ -356,6 +579,12 @@ class GraphViewWidget(FigureCanvas):
 
 
 class GraphPageWidget(QWidget):
+    # part of the model scored by the calc button, None for pages without
+    # calc. calcOptions are added to the options of every run
+    calcPart = None
+    calcOptions = {}
+    data = None
+
     def __init__(self, parent, page_name, x_data, y_data, config={}, graphoptions={}):
         super().__init__(parent=parent)
         self.parentwidget = parent
@@ -368,8 +597,16 @@ class GraphPageWidget(QWidget):
         self.nowTranslation = None
         self.nowZooming = None
         self.history_index = -1
-        self.limhistory = []
+        self.limhistory = deque()
+        self.panTimer = QTimer(self)
+        self.panTimer.setSingleShot(True)
+        self.panTimer.setInterval(PAN_FRAME_MS)
+        self.panTimer.timeout.connect(self.panFrame)
         self.require_updategraph = False
+        self.drawn_lim = None
+        self.models = {}
+        self.calcRun = None
+        self.pyramids = {}
 
         self.appendData(x_data, y_data, "data", graphoptions)
 
@@ -413,16 +650,31 @@ class GraphPageWidget(QWidget):
         self.require_updategraph = True
         self.datas.append((name, x, y, options))
 
+    def pyramid(self, index):
+        # series of a Data share the pyramid cached on it, the others get
+        # their own on the first draw
+        name, x, y, options = self.datas[index]
+        source = options.get("source")
+        if source is not None:
+            data, x_col, y_col = source
+            return data.pyramid(x_col, y_col)
+        if index not in self.pyramids:
+            self.pyramids[index] = MinMaxPyramid(x, y)
+        return self.pyramids[index]
+
     def updateGraph(self):
+        # series not drawn yet get their artist, a change of the limits
+        # re-queries the visible points of every artist. everything else is
+        # a blit of the series over the cached background
+        view = self.graphViewWidget
+        full = False
         if self.require_updategraph is True:
-            self.graphViewWidget.clear()
-            for name, x, y, options in self.datas:
-                graphtype = options.get("graphtype")
-                twinx = options.get("twinx")
-                if graphtype == "scatter":
-                    self.graphViewWidget.scatter(x, y, label=name, twinx=twinx)
-                else:
-                    self.graphViewWidget.plot(x, y, label=name, twinx=twinx)
+            for index, (name, x, y, options) in enumerate(self.datas):
+                if index in view.series:
+                    continue
+                scatter = options.get("graphtype") == "scatter"
+                pyramid = None if scatter else self.pyramid(index)
+                full |= view.addSeries(index, x, y, label=name, twinx=options.get("twinx"), scatter=scatter, pyramid=pyramid)
             self.require_updategraph = False
 
         if self.xlim:
@@ -433,13 +685,22 @@ class GraphPageWidget(QWidget):
             self.graphViewWidget.setYlim(self.ylim)
         else:
             self.ylim = self.graphViewWidget.getYlim()
+        if self.drawn_lim != (self.xlim, self.ylim):
+            # the ticks move with the limits, so the background is drawn again
+            view.refreshSeries()
+            self.drawn_lim = (self.xlim, self.ylim)
+            full = True
 
-        self.graphViewWidget.draw()
+        view.render(full)
 
         if self.history_index == -1:
             self.updateLimHistory()
 
     def updateLimHistory(self):
+        if len(self.limhistory) >= LIM_HISTORY_SIZE:
+            # drop the oldest entry after the first one, which reset goes to
+            del self.limhistory[1]
+            self.history_index = max(self.history_index - 1, 0)
         self.history_index += 1
         self.limhistory.insert(self.history_index, (self.xlim, self.ylim))
 
@@ -487,10 +748,24 @@ class GraphPageWidget(QWidget):
             min_value, max_value = ylim 
             self.ylim = (min_value+dy, max_value+dy)
 
-        self.updateGraph()
-        self.updateLimHistory()
+        # motion events between two frames only move the pending limits
+        if not self.panTimer.isActive():
+            self.panTimer.start()
+
+    def panFrame(self):
+        # series at the pending limits blitted over the background of the
+        # drag start. ticks and history catch up when the drag ends
+        view = self.graphViewWidget
+        view.setXlim(self.xlim)
+        view.setYlim(self.ylim)
+        view.refreshSeries()
+        view.render()
 
     def translationEndEvent(self):
+        self.panTimer.stop()
+        if self.nowTranslation is not None and self.nowTranslation != (self.xlim, self.ylim):
+            self.updateGraph()
+            self.updateLimHistory()
         self.nowTranslation = None
 
     def zoomSelectEvent(self, obj):
@@ -513,36 +788,75 @@ class GraphPageWidget(QWidget):
         self.updateLimHistory()
 
     def callCalcProcess(self, option):
-        worker = Worker(self.calcProcess, option)
-        #worker.signals.result.connect(self.tempGraphShow)
+        # a run still going is dropped for the new one
+        if self.calcPart is None:
+            return
+        option = dict(option, **self.calcOptions)
+        if self.calcRun is not None:
+            self.calcRun.cancel()
+        self.calcOptionEditWidget.setProgress(0)
+        sizes = self.modelSizes(option)
+        worker = CalcWorker(sharedData(self.data), self.calcPart, option, sizes, self.models.get(self.modelKey(option)))
+        worker.signals.progress.connect(lambda value, worker=worker: self.calcProgress(worker, value))
+        worker.signals.result.connect(self.calcResult)
+        worker.signals.error.connect(lambda error, worker=worker: self.calcError(worker, error))
+        self.calcRun = worker
         self.threadpool.start(worker)
 
-    def calcProcess(self, option, progress_callback):
+    def cancelCalc(self):
+        # a cancelled run reports nothing back to the page
+        if self.calcRun is not None:
+            self.calcRun.cancel()
+            self.calcRun = None
+
+    def calcProgress(self, worker, value):
+        if worker is self.calcRun:
+            self.calcOptionEditWidget.setProgress(value)
+
+    def calcResult(self, obj):
+        worker, model, result = obj
+        if worker is not self.calcRun:
+            return
+        self.calcRun = None
+        # the bg statistics are fitted once per bg range and reused by every
+        # calc on the same range
+        self.models[self.modelKey(worker.option)] = model
+        self.applyResult(worker.option, result)
+
+    def calcError(self, worker, error):
+        if worker is not self.calcRun:
+            return
+        self.calcRun = None
+        self.calcOptionEditWidget.setProgress(0)
+        exctype, value, _ = error
+        QMessageBox.warning(self, "calc error", "%s: %s" % (exctype.__name__, value))
+
+    def applyResult(self, option, result):
         pass
 
+    def modelSizes(self, option):
+        # (step_size, window_size) of the model fitted for option
+        return (option["step_size"], 8)
+
+    def modelKey(self, option):
+        return (self.calcPart, option["bg_time_init"], option["bg_time_end"]) + self.modelSizes(option)
+
 
 class MaxTemperatureGraphPageWidget(GraphPageWidget):
     counter = 1
+    calcPart = "temperature"
 
     def __init__(self, parent, page_name, data, config=None):
         x_data = data.get_col(TIME)
         y_data = data.get_col(MAX_TEMPERATURE)
-        super().__init__(parent, page_name, x_data, y_data, config)
+        super().__init__(parent, page_name, x_data, y_data, config, {"source": (data, TIME, MAX_TEMPERATURE)})
         self.data = data
-        self.xlim = (min(x_data), max(x_data))
+        self.xlim = (x_data.min(), x_data.max())
         self.updateGraph()
         self.ylim = self.graphViewWidget.getYlim()
 
-    def calcProcess(self, option, progress_callback):
-        bg_time_init = option["bg_time_init"]
-        bg_time_end = option["bg_time_end"]
-        tg_time_init = option["tg_time_init"]
-        tg_time_end = option["tg_time_end"]
-        step_size = option["step_size"]
-        thres_sd_heat = option["thres_sd_heat"]
-        error_data, _ = temperature_process(self.data, bg_time_init, bg_time_end, tg_time_init, tg_time_end, step_size=step_size, thres_sd_heat=thres_sd_heat, save_svg=False, show_graph=False)
-        x = error_data.get_col(TIME)
-        y = error_data.get_col(TEMPERATURE_ERROR_DATA)
+    def applyResult(self, option, result):
+        x, y, _ = result
         label = "error" + str(self.counter)
         self.appendData(x, y, label, {"twinx": True})
         self.counter += 1
@@ -551,25 +865,19 @@ class MaxTemperatureGraphPageWidget(GraphPageWidget):
 
 class MinTemperatureGraphPageWidget(GraphPageWidget):
     counter = 1
+    calcPart = "temperature"
+    calcOptions = {"column": MIN_TEMPERATURE}
     def __init__(self, parent, page_name, data, config=None):
         x_data = data.get_col(TIME)
         y_data = data.get_col(MIN_TEMPERATURE)
-        super().__init__(parent, page_name, x_data, y_data, config)
+        super().__init__(parent, page_name, x_data, y_data, config, {"source": (data, TIME, MIN_TEMPERATURE)})
         self.data = data
-        self.xlim = (min(x_data), max(x_data))
+        self.xlim = (x_data.min(), x_data.max())
         self.updateGraph()
         self.ylim = self.graphViewWidget.getYlim()
 
-    def calcProcess(self, option, progress_callback):
-        bg_time_init = option["bg_time_init"]
-        bg_time_end = option["bg_time_end"]
-        tg_time_init = option["tg_time_init"]
-        tg_time_end = option["tg_time_end"]
-        step_size = option["step_size"]
-        thres_sd_heat = option["thres_sd_heat"]
-        error_data, _ = temperature_process(self.data, bg_time_init, bg_time_end, tg_time_init, tg_time_end, step_size=step_size, thres_sd_heat=thres_sd_heat, save_svg=False, show_graph=False)
-        x = error_data.get_col(TIME)
-        y = error_data.get_col(TEMPERATURE_ERROR_DATA)
+    def applyResult(self, option, result):
+        x, y, _ = result
         label = "error" + str(self.counter)
         self.appendData(x, y, label, {"twinx": True})
         self.counter += 1
@@ -578,25 +886,18 @@ class MinTemperatureGraphPageWidget(GraphPageWidget):
 
 class DistanceGraphPageWidget(GraphPageWidget):
     counter = 1
+    calcPart = "distance"
     def __init__(self, parent, page_name, data, config=None):
         x_data = data.get_col(TIME)
         y_data = data.get_col(DISTANCE)
-        super().__init__(parent, page_name, x_data, y_data, config)
+        super().__init__(parent, page_name, x_data, y_data, config, {"source": (data, TIME, DISTANCE)})
         self.data = data
-        self.xlim = (min(x_data), max(x_data))
+        self.xlim = (x_data.min(), x_data.max())
         self.updateGraph()
         self.ylim = self.graphViewWidget.getYlim()
 
-    def calcProcess(self, option, progress_callback):
-        bg_time_init = option["bg_time_init"]
-        bg_time_end = option["bg_time_end"]
-        tg_time_init = option["tg_time_init"]
-        tg_time_end = option["tg_time_end"]
-        step_size = option["step_size"]
-        welch_thres = option["welch_thres"]
-        error_data, _ = distance_process(self.data, bg_time_init, bg_time_end, tg_time_init, tg_time_end, step_size=step_size, save_svg=False, show_graph=False, welch_thres=welch_thres)
-        x = error_data.get_col(TIME)
-        y = error_data.get_col(ERROR_VALUE)
+    def applyResult(self, option, result):
+        x, y, _ = result
         label = "error" + str(self.counter)
         self.appendData(x, y, label, {"twinx": True})
         self.counter += 1
@@ -605,6 +906,7 @@ class DistanceGraphPageWidget(GraphPageWidget):
 
 class CorGraphPageWidget(GraphPageWidget):
     counter = 1
+    calcPart = "cor"
     addpageSignal = pyqtSignal(object)
 
     def __init__(self, parent, page_name, data, config=None):
@@ -617,16 +919,12 @@ class CorGraphPageWidget(GraphPageWidget):
         self.ylim = self.graphViewWidget.getYlim()
         self.graphViewWidget.modechange("zoom")
 
-    def calcProcess(self, option, progress_callback):
-        bg_time_init = option["bg_time_init"]
-        bg_time_end = option["bg_time_end"]
-        tg_time_init = option["tg_time_init"]
-        tg_time_end = option["tg_time_end"]
-        step_size = option["step_size"]
-        sd_num = option["sd_num"]
-        error_step = option["error_step"]
-        error_data, pb_info = cor_process(self.data, bg_time_init, bg_time_end, tg_time_init, tg_time_end, step_size=step_size, SD_NUM=sd_num, ERROR_STEP=error_step, save_svg=False, show_graph=False)
+    def modelSizes(self, option):
+        # the cor windows take their size from step_size
+        return (8, option["step_size"])
 
+    def applyResult(self, option, result):
+        time, error, pb_info = result
         slope = pb_info["slope"]
         n = pb_info["n"]
         n_plus = pb_info["n_plus"]
@@ -648,8 +946,8 @@ class CorGraphPageWidget(GraphPageWidget):
 
         self.updateGraph()
 
-        x_data = error_data.get_col(TIME)
-        y_data = error_data.get_col(COR_ERROR_VALUE)
+        x_data = pd.Series(time)
+        y_data = pd.Series(error)
         name = "cor error"+counter
         self.addpageSignal.emit({"x_data": x_data, "y_data": y_data, "name": name})
 
@@ -661,6 +959,8 @@ class GraphWidget(QTabWidget):
     def __init__(self, data, configs):
         super().__init__()
         self.data = data
+        self.setTabsClosable(True)
+        self.tabCloseRequested.connect(self.closePage)
 
         if configs["temperature_timerange_predict"] or configs["distance_timerange_predict"] or configs["cor_timerange_predict"]:
             time_data = data.get_col(TIME)
@@ -707,6 +1007,20 @@ class GraphWidget(QTabWidget):
         widget = GraphPageWidget(self, name, x_data, y_data)
         self.addTab(widget, name)
 
+    def closePage(self, index):
+        page = self.widget(index)
+        page.cancelCalc()
+        self.removeTab(index)
+        page.deleteLater()
+        # the shared copy of the data goes with the last page using it
+        if all(self.widget(i).data is not self.data for i in range(self.count())):
+            releaseSharedData(self.data)
+
+    def closeAll(self):
+        while self.count():
+            self.closePage(self.count() - 1)
+        releaseSharedData(self.data)
+
 class LoadInfoWidget(QWidget):
     temperature_widgets = {}
     distance_widgets = {}
@@ -957,8 +1271,19 @@ class LoadInfoWidget(QWidget):
 
 
 class LoadOptionWidget(QWidget):
-    def __init__(self):
+    def __init__(self, configs):
         super().__init__()
+        vbox = QVBoxLayout()
+        self.setLayout(vbox)
+
+        self.useCacheCheckbox = QCheckBox("use cache")
+        self.useCacheCheckbox.setChecked(configs["use_cache"])
+        vbox.addWidget(self.useCacheCheckbox)
+
+        self.clearCacheButton = QPushButton("Clear cache")
+        self.clearCacheButton.clicked.connect(lambda b: clear_cache())
+        vbox.addWidget(self.clearCacheButton)
+        vbox.addStretch()
 
 class LoadWidget(QWidget):
     targetpath = ""
@@ -993,6 +1318,7 @@ class LoadWidget(QWidget):
         "temperature_timerange_predict": False,
         "distance_timerange_predict": False,
         "cor_timerange_predict": False,
+        "use_cache": True,
     }
 
     def __init__(self, parent=None):
@@ -1002,7 +1328,7 @@ class LoadWidget(QWidget):
         self.innerLayout = QHBoxLayout()
         self.setLayout(self.innerLayout)
         self.loadInfoWidget = LoadInfoWidget(self.configs)
-        self.loadOptionWidget = LoadOptionWidget()
+        self.loadOptionWidget = LoadOptionWidget(self.configs)
 
         self.innerLayout.addWidget(self.loadInfoWidget, 4)
         self.innerLayout.addWidget(self.loadOptionWidget, 1)
@@ -1038,6 +1364,8 @@ class LoadWidget(QWidget):
         self.configs["cor"]["sd_num"] = w["sd_num"].value()
         self.configs["cor_timerange_predict"] = not (w["cor_timerange_predict"].isChecked())
 
+        self.configs["use_cache"] = self.loadOptionWidget.useCacheCheckbox.isChecked()
+
     def loadEvent(self):
         self.getOptions()
         datas = {}
@@ -1058,6 +1386,15 @@ class LoadWidget(QWidget):
         else:
             return None
 
+    def openDirectory(self):
+        dirname = QFileDialog.getExistingDirectory(self, "Open CSV directory", "./")
+        if dirname:
+            self.targetpath = dirname
+            self.loadEvent()
+            return dirname
+        else:
+            return None
+
 
 class FileListWidget(QDockWidget):
     def __init__(self, name):
@@ -1113,17 +1450,29 @@ class MainWidget(QStackedWidget):
     def makeGraph(self, datas):
         path = datas["datapath"]
         configs = datas["configs"]
-        loader = Loader(path, names=[TIME, MAX_TEMPERATURE, MAX_POS_X, MAX_POS_Y, MIN_TEMPERATURE, MIN_POS_X, MIN_POS_Y])
-        loader.set_preprocess(a3_preprocess)
-
-        data = loader.load()
-        data = calc_distance(data)
+        data = load_data(path, "a3", use_cache=configs["use_cache"])
 
+        # loading a path again replaces its graphs
+        self.closeGraph(path)
         widget = GraphWidget(data, configs)
-        index = self.addWidget(widget)
-        self.graphWidgets[path] = index
+        self.addWidget(widget)
+        self.graphWidgets[path] = widget
 
-        self.setCurrentIndex(index)
+        self.setCurrentWidget(widget)
+
+    def closeGraph(self, path):
+        widget = self.graphWidgets.pop(path, None)
+        if widget is None:
+            return
+        widget.closeAll()
+        self.removeWidget(widget)
+        widget.deleteLater()
+
+    def closeCurrentGraph(self):
+        for path, widget in list(self.graphWidgets.items()):
+            if widget is self.currentWidget():
+                self.closeGraph(path)
+                self.setCurrentIndex(self.loadWidgetIndex)
 
     def openFile(self):
         filename = self.loadWidget.openFile()
@@ -1131,12 +1480,19 @@ class MainWidget(QStackedWidget):
             index = self.currentIndex()
             self.newwidget_signal.emit({"filename": filename, "index": index})
 
+    def openDirectory(self):
+        dirname = self.loadWidget.openDirectory()
+        if dirname:
+            index = self.currentIndex()
+            self.newwidget_signal.emit({"filename": dirname, "index": index})
+
     def openLoadPage(self):
         self.setCurrentIndex(self.loadWidgetIndex)
 
     def changePage(self, path):
-        index = self.graphWidgets[path]
-        self.setCurrentIndex(index)
+        widget = self.graphWidgets.get(path)
+        if widget is not None:
+            self.setCurrentWidget(widget)
 
 
 class MainWindow(QMainWindow):
@@ -1184,6 +1540,12 @@ class MainWindow(QMainWindow):
     def openFileActionTrigger(self):
         self.mainWidget.openFile()
 
+    def openDirectoryActionTrigger(self):
+        self.mainWidget.openDirectory()
+
+    def closeFileActionTrigger(self):
+        self.mainWidget.closeCurrentGraph()
+
     def openConfigFileActionTrigger(self):
         (filename, kakutyousi) = QFileDialog.getOpenFileName(self, "Open Config file", "./", "json files (*.json)")
 
@@ -1197,6 +1559,12 @@ class MainWindow(QMainWindow):
 
         openDirAction = QAction("Open Directory", self)
         openDirAction.setStatusTip("Directory File")
+        openDirAction.triggered.connect(self.openDirectoryActionTrigger)
+
+        closeFileAction = QAction("Close", self)
+        closeFileAction.setShortcut("Ctrl+W")
+        closeFileAction.setStatusTip("Close File")
+        closeFileAction.triggered.connect(self.closeFileActionTrigger)
 
         openConfigFileAction = QAction("Open Config", self)
         openConfigFileAction .setStatusTip("Config file")
@@ -1210,6 +1578,7 @@ class MainWindow(QMainWindow):
         fileMenu = menubar.addMenu('File')
         fileMenu.addAction(openFileAction)
         fileMenu.addAction(openDirAction)
+        fileMenu.addAction(closeFileAction)
         fileMenu.addSeparator()
         fileMenu.addAction(exitAction)
 
@@ -1235,9 +1604,11 @@ class MainWindow(QMainWindow):
         self.mainWidget.changePage(item)
 
 
-app = QApplication(sys.argv)
+if __name__ == "__main__":
+    app = QApplication(sys.argv)
+    app.aboutToQuit.connect(closeCalc)
 
-mainwindow = MainWindow()
-mainwindow.show()
+    mainwindow = MainWindow()
+    mainwindow.show()
 
-sys.exit(app.exec_())
+    sys.exit(app.exec_())
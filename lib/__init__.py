@@ -1 +1,7 @@
 from .lib import *
+from .cache import *
+from .slope import *
+from .bootstrap import *
+from .scan import *
+from .shared import *
+from .decimate import *
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+#encoding: utf-8
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import sparse
+
+from .slope import count_slopes, select_slope
+
+# bootstrap of the Passing-Bablok fit used by cor_process.
+#
+# a resample that takes point i w[i] times has the slope of the original pair
+# (i, j) w[i]*w[j] times, and repeated points give no slope at all. so the
+# pairwise slopes are sorted once and every replicate is a weighted median
+# over the same sorted list. the median of a replicate stays close to the
+# median of the data, within about len(slopes)/sqrt(n) positions. so the
+# weight below and above a window of positions around it comes from one
+# sparse product per replicate, and only the window is summed position by
+# position. a replicate whose median falls outside the window is fitted
+# again with a window twice as wide.
+#
+# above BOOTSTRAP_MAX_PAIRS a fixed random subset of the pairs stands in for
+# the full list. its median differs from the slope of the data by the
+# sampling error of the subset, so the replicates are shifted by the
+# difference between the exact fit and the fit of the subset, and the bands
+# describe the slope cor_process reports.
+
+BOOTSTRAP_MAX_PAIRS = 2 * 10**6
+BOOTSTRAP_CHUNK_CELLS = 2**22
+# half width of the first window, in len(slopes)/sqrt(n) positions
+BOOTSTRAP_WINDOW = 1.0
+
+_boot = None
+
+
+def _pairs(x, y, max_pairs, rng):
+    n = x.size
+    if n*(n-1)//2 <= max_pairs:
+        i, j = np.triu_indices(n, 1)
+    else:
+        i = rng.integers(0, n, max_pairs)
+        j = rng.integers(0, n, max_pairs)
+        i, j = np.minimum(i, j), np.maximum(i, j)
+    valid = x[i] != x[j]
+    i = i[valid]
+    j = j[valid]
+    slopes = (y[j] - y[i]) / (x[j] - x[i])
+    order = np.argsort(slopes, kind="stable")
+    return slopes[order], i[order], j[order]
+
+
+def _boot_init(x, y, slopes, i, j, sd_num):
+    global _boot
+    _boot = (x, y, slopes, i, j, sd_num)
+
+
+def _window(m, n):
+    # positions of the first window, centred on the median of the data
+    below = int(np.searchsorted(_boot[2], -1, side="left"))
+    center = below + (m - below - 1) // 2
+    half = int(np.ceil(BOOTSTRAP_WINDOW * m / np.sqrt(n)))
+    return max(center - half, 0), min(center + half + 1, m)
+
+
+def _chunk_rows(width):
+    # replicates summed together over a window of width positions
+    return max(BOOTSTRAP_CHUNK_CELLS // max(width, 1), 1)
+
+
+def _segments(a, b):
+    # the pairs outside the window [a, b), cut at the -1 slope bound, as
+    # (end position, sparse point x point matrix of the pairs)
+    x, _, slopes, i, j, _ = _boot
+    n = x.size
+    m = slopes.size
+    below = int(np.searchsorted(slopes, -1, side="left"))
+    cuts = sorted({0, a, b, m} | ({below} if not a < below < b else set()))
+    segments = []
+    for start, end in zip(cuts[:-1], cuts[1:]):
+        if start < end and (end <= a or start >= b):
+            pairs = sparse.csr_matrix((np.ones(end - start), (j[start:end], i[start:end])), shape=(n, n))
+            segments.append((end, pairs))
+    return below, segments
+
+
+def _weighted_slopes(w, a, b, below, segments):
+    # slope of every row, and whether both its median ranks fell in the
+    # window of positions [a, b)
+    _, _, slopes, i, j, _ = _boot
+    m = slopes.size
+    # w[p]*w[q] summed over the pairs of every segment
+    outside = [(end, ((pairs @ w.T) * w.T).sum(axis=0)) for end, pairs in segments]
+    cum = np.cumsum(w[:, i[a:b]] * w[:, j[a:b]], axis=1)
+
+    def weight_before(k):
+        # weight of the positions p < k, k a cut or inside the window
+        weight = np.zeros(w.shape[0])
+        for end, value in outside:
+            if end <= k:
+                weight += value
+        if k > a:
+            weight += cum[:, min(k, b) - a - 1]
+        return weight
+
+    base = weight_before(a)
+    shift = weight_before(below)
+    n_pb = weight_before(m) - shift
+
+    found = n_pb > 0
+    median = []
+    for rank in (shift + (n_pb - 1) // 2, shift + n_pb // 2):
+        found &= (base <= rank) & (rank < base + cum[:, -1])
+        position = np.array([np.searchsorted(row, r, side="right") for row, r in zip(cum, rank - base)], dtype=np.int64)
+        median.append(slopes[np.minimum(a + position, m - 1)])
+    slope = np.where(n_pb > 0, (median[0] + median[1]) / 2, np.nan)
+    return slope, found | (n_pb <= 0)
+
+
+def _boot_fit(w):
+    # slope, intercept and band edges for every row of resample counts w
+    x, y, slopes, i, j, sd_num = _boot
+    n = x.size
+    m = slopes.size
+    if m == 0:
+        return np.full((w.shape[0], 4), np.nan)
+    w = np.asarray(w, dtype=np.float64)
+
+    # slopes below -1 are dropped from the bottom, as in passing_bablock
+    slope = np.empty(w.shape[0])
+    rows = np.arange(w.shape[0])
+    a, b = _window(m, n)
+    while rows.size:
+        below, segments = _segments(a, b)
+        missed = []
+        step = _chunk_rows(b - a)
+        for start in range(0, rows.size, step):
+            chunk = rows[start:start + step]
+            value, found = _weighted_slopes(w[chunk], a, b, below, segments)
+            slope[chunk] = value
+            missed.append(chunk[~found])
+        rows = np.concatenate(missed)
+        half = b - a
+        a, b = max(a - half, 0), min(b + half, m)
+
+    sec = (w @ y - slope*(w @ x)) / n
+    # weighted sum of squared residuals around the fitted line
+    ss = w @ (y*y) - 2*slope*(w @ (x*y)) + slope**2*(w @ (x*x)) - n*sec**2
+    d = sd_num * np.sqrt(np.maximum(ss, 0) / (n - 1))
+    return np.column_stack([slope, sec, sec + d, sec - d])
+
+
+def _boot_chunk(args):
+    size, seed = args
+    n = _boot[0].size
+    rng = np.random.default_rng(seed)
+    return _boot_fit(rng.multinomial(n, np.full(n, 1/n), size=size))
+
+
+def _exact_fit(x, y, sd_num):
+    # the fit of the data over all pairs, in the columns of _boot_fit
+    shift = count_slopes(x, y, hi=-1)
+    total = count_slopes(x, y)
+    n_pb = total - shift
+    if n_pb <= 0:
+        return np.full(4, np.nan)
+    rng = np.random.default_rng(0)
+    low = select_slope(x, y, shift + (n_pb - 1) // 2, total=total, rng=rng)
+    high = select_slope(x, y, shift + n_pb // 2, total=total, rng=rng)
+    slope = (low + high) / 2
+    sec = (y - slope*x).mean()
+    d = sd_num * (y - (x*slope + sec)).std(ddof=1)
+    return np.array([slope, sec, sec + d, sec - d])
+
+
+def cor_bootstrap(x_data, y_data, n_boot=1000, SD_NUM=1.5, alpha=0.05, max_workers=None, seed=None, max_pairs=BOOTSTRAP_MAX_PAIRS):
+    # percentile bands of slope, intercept and band edges over n_boot
+    # resamples of the background windows
+    x = np.asarray(x_data, dtype=np.float64)
+    y = np.asarray(y_data, dtype=np.float64)
+    finite = np.isfinite(x) & np.isfinite(y)
+    x = x[finite]
+    y = y[finite]
+
+    seeds = np.random.SeedSequence(seed)
+    rng = np.random.default_rng(seeds.spawn(1)[0])
+    slopes, i, j = _pairs(x, y, max_pairs, rng)
+
+    workers = max_workers or os.cpu_count() or 1
+    chunk = max(-(-n_boot // workers), 1)
+    sizes = [min(chunk, n_boot - start) for start in range(0, n_boot, chunk)]
+    tasks = list(zip(sizes, seeds.spawn(len(sizes))))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_boot_init, initargs=(x, y, slopes, i, j, SD_NUM)) as executor:
+        replicates = np.concatenate(list(executor.map(_boot_chunk, tasks)))
+
+    n = x.size
+    if n*(n-1)//2 > max_pairs and slopes.size:
+        # the replicates of the subset, moved onto the exact fit
+        _boot_init(x, y, slopes, i, j, SD_NUM)
+        replicates += _exact_fit(x, y, SD_NUM) - _boot_fit(np.ones((1, n)))[0]
+
+    q = [100*alpha/2, 100*(1-alpha/2)]
+    bands = {}
+    for k, name in enumerate(["slope", "n", "n_plus", "n_minus"]):
+        bands[name] = tuple(np.nanpercentile(replicates[:, k], q))
+    bands["replicates"] = replicates
+    return bands
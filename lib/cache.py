@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+#encoding: utf-8
+import os
+import glob
+import json
+import shutil
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+# bump when the stored columns or their calculation change
+CACHE_VERSION = 3
+CACHE_MAX_SIZE = 4 * 1024**3
+META_FILE = "meta.json"
+# files of a recording given as a directory
+DIRECTORY_PATTERN = "*.csv"
+
+
+def directory_files(dirname, pattern=DIRECTORY_PATTERN):
+    return sorted(glob.glob(os.path.join(dirname, pattern)))
+
+
+class Cache(object):
+    # one .npy file per column so that a hit is memory-mapped instead of parsed
+    def __init__(self, cache_dir, max_size=CACHE_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def key(self, filename, format, pattern=DIRECTORY_PATTERN):
+        src = "%s:%s:%d" % (os.path.abspath(filename), format, CACHE_VERSION)
+        if os.path.isdir(filename):
+            # only the files that are loaded, so other files do not invalidate
+            src += ":" + pattern
+            paths = directory_files(filename, pattern)
+        else:
+            paths = [filename]
+        for path in paths:
+            st = os.stat(path)
+            src += ":%s:%d:%d" % (os.path.basename(path), st.st_size, st.st_mtime_ns)
+        return hashlib.sha1(src.encode("utf-8")).hexdigest()
+
+    def get(self, filename, format):
+        path = os.path.join(self.cache_dir, self.key(filename, format))
+        meta_path = os.path.join(path, META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        columns = {}
+        for name in meta["columns"]:
+            columns[name] = np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+        # mtime of meta file is the last access time used for eviction
+        os.utime(meta_path)
+        return pd.DataFrame(columns, copy=False)
+
+    def put(self, filename, format, df):
+        key = self.key(filename, format)
+        path = os.path.join(self.cache_dir, key)
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name in df.columns:
+            np.save(os.path.join(tmp_path, name + ".npy"), df[name].to_numpy(), allow_pickle=False)
+        meta = {
+            "filename": os.path.abspath(filename),
+            "format": format,
+            "version": CACHE_VERSION,
+            "columns": list(df.columns),
+        }
+        with open(os.path.join(tmp_path, META_FILE), "w") as f:
+            json.dump(meta, f)
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmp_path, path)
+        self.evict()
+
+    def entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, key)
+            meta_path = os.path.join(path, META_FILE)
+            if not os.path.exists(meta_path):
+                continue
+            with open(meta_path) as f:
+                meta = json.load(f)
+            size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+            entries.append((os.path.getmtime(meta_path), size, path, meta))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _, _ in self.entries())
+
+    def evict(self):
+        entries = sorted(self.entries(), key=lambda e: e[0])
+        total = sum(size for _, size, _, _ in entries)
+        while entries and total > self.max_size:
+            _, size, path, _ = entries.pop(0)
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def invalidate(self, filename=None):
+        if filename is not None:
+            filename = os.path.abspath(filename)
+        for _, _, path, meta in self.entries():
+            if filename is None or meta["filename"] == filename:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def clear(self):
+        self.invalidate()
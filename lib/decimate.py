@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+#encoding: utf-8
+import numpy as np
+
+# point reduction for drawing. a line of millions of samples is drawn into a
+# few thousand pixel columns, and the first, min, max and last sample of every
+# column are enough to rasterize it the same way, spikes included. scatter
+# plots keep one point per pixel cell instead.
+
+# columns used when the drawing width is not known yet
+DECIMATE_BUCKETS = 2000
+
+
+def as_numeric(x):
+    # datetime64 as int64 ns, everything else as float64
+    x = np.asarray(x)
+    if x.dtype.kind == "M":
+        return x.astype("datetime64[ns]").view(np.int64)
+    return x.astype(np.float64, copy=False)
+
+
+def _bucket_of(x, buckets, lo=None, hi=None):
+    lo = x[0] if lo is None else lo
+    hi = x[-1] if hi is None else hi
+    if hi <= lo:
+        return np.zeros(x.size, dtype=np.int64)
+    bucket = ((x - lo) / (hi - lo) * buckets).astype(np.int64)
+    return np.clip(bucket, 0, buckets - 1)
+
+
+def line_indices(x, y, buckets=DECIMATE_BUCKETS):
+    # sorted indices of the first, min, max and last sample of every bucket,
+    # where the x range is cut into buckets of equal width. x must be sorted
+    x = as_numeric(x)
+    y = np.asarray(y, dtype=np.float64)
+    n = x.size
+    if n <= 4*buckets:
+        return np.arange(n)
+
+    bucket = _bucket_of(x, buckets)
+    starts = np.flatnonzero(np.diff(bucket, prepend=-1))
+    counts = np.diff(starts, append=n)
+    segment = np.repeat(np.arange(starts.size), counts)
+
+    keep = [starts, starts + counts - 1]
+    with np.errstate(invalid="ignore"):
+        for reduce in (np.fmin, np.fmax):
+            # a bucket of nan only keeps its first and last sample, so gaps
+            # stay gaps
+            extreme = reduce.reduceat(y, starts)
+            position = np.flatnonzero(y == extreme[segment])
+            _, first = np.unique(segment[position], return_index=True)
+            keep.append(position[first])
+    return np.unique(np.concatenate(keep))
+
+
+def scatter_indices(x, y, width=DECIMATE_BUCKETS, height=DECIMATE_BUCKETS):
+    # sorted indices of the first point in every occupied cell of a width x
+    # height grid over the data range. points with nan are dropped
+    x = as_numeric(x)
+    y = np.asarray(y, dtype=np.float64)
+    finite = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    if finite.size <= width*height // 16:
+        return finite
+    fx = x[finite]
+    fy = y[finite]
+    column = _bucket_of(fx, width, fx.min(), fx.max())
+    row = _bucket_of(fy, height, fy.min(), fy.max())
+    _, first = np.unique(column*height + row, return_index=True)
+    return finite[np.sort(first)]
+
+
+def decimate(x, y, buckets=DECIMATE_BUCKETS, scatter=False, height=None):
+    # x and y reduced for drawing, as numpy arrays
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if scatter:
+        index = scatter_indices(x, y, buckets, height or buckets)
+    else:
+        if x.size > 1 and (as_numeric(x[1:]) < as_numeric(x[:-1])).any():
+            order = np.argsort(as_numeric(x), kind="stable")
+            x = x[order]
+            y = y[order]
+        index = line_indices(x, y, buckets)
+    return x[index], y[index]
+
+
+# a MinMaxPyramid keeps, for blocks of PYRAMID_FACTOR**k samples at every level
+# k >= 1, the positions of the block min and max. a view of any x range then
+# reads the coarsest level still giving about two blocks per bucket, so
+# zooming into a few minutes of a month long recording reads raw samples and
+# the full view reads a few thousand block extremes
+PYRAMID_FACTOR = 4
+
+
+class MinMaxPyramid(object):
+    def __init__(self, x, y, factor=PYRAMID_FACTOR):
+        x = as_numeric(x)
+        self.order = None
+        if x.size > 1 and (x[1:] < x[:-1]).any():
+            self.order = np.argsort(x, kind="stable")
+            x = x[self.order]
+            y = np.asarray(y)[self.order]
+        self.x = x
+        self.y = np.asarray(y, dtype=np.float64)
+        self.factor = factor
+
+        # nan never wins, but a block of nan keeps a nan position
+        low = np.where(np.isnan(self.y), np.inf, self.y)
+        high = np.where(np.isnan(self.y), -np.inf, self.y)
+        dtype = np.int32 if x.size < 2**31 else np.int64
+        position = np.arange(x.size, dtype=dtype)
+        argmin = argmax = position
+        self.levels = []
+        while argmin.size > 1:
+            argmin = self._reduce(argmin, low, np.argmin, np.inf)
+            argmax = self._reduce(argmax, high, np.argmax, -np.inf)
+            self.levels.append((argmin, argmax))
+
+    def _reduce(self, position, values, arg, fill):
+        blocks = -(-position.size // self.factor)
+        pad = blocks*self.factor - position.size
+        value = np.concatenate([values[position], np.full(pad, fill)]).reshape(blocks, self.factor)
+        position = np.concatenate([position, np.full(pad, position[-1], dtype=position.dtype)]).reshape(blocks, self.factor)
+        return position[np.arange(blocks), arg(value, axis=1)]
+
+    def _extremes(self, start, end):
+        # positions of the raw min and max of y[start:end]
+        if end <= start:
+            return np.empty(0, dtype=np.int64)
+        y = self.y[start:end]
+        nan = np.isnan(y)
+        return start + np.array([np.argmin(np.where(nan, np.inf, y)), np.argmax(np.where(nan, -np.inf, y))])
+
+    def query(self, lo=-np.inf, hi=np.inf, buckets=DECIMATE_BUCKETS):
+        # indices into the original x, y for drawing the range [lo, hi] with
+        # buckets columns. one sample on each side of the range is included so
+        # the line runs to the edges
+        i0 = max(int(np.searchsorted(self.x, lo, side="left")) - 1, 0)
+        i1 = min(int(np.searchsorted(self.x, hi, side="right")) + 1, self.x.size)
+        if i1 - i0 <= 4*buckets:
+            index = np.arange(i0, i1)
+        else:
+            level = 0
+            block = self.factor
+            while level + 1 < len(self.levels) and (i1 - i0) // (block*self.factor) >= 2*buckets:
+                level += 1
+                block *= self.factor
+            argmin, argmax = self.levels[level]
+            # blocks inside the range give their extremes, the partly covered
+            # blocks at the edges are scanned raw (less than block samples each)
+            b0 = -(-i0 // block)
+            b1 = max(i1 // block, b0)
+            edges = [(i0, min(b0*block, i1)), (max(b1*block, b0*block), i1)]
+            index = np.unique(np.concatenate([[i0, i1 - 1], argmin[b0:b1], argmax[b0:b1]] + [self._extremes(a, b) for a, b in edges]))
+            index = index[line_indices(self.x[index], self.y[index], buckets)]
+        if self.order is not None:
+            index = self.order[index]
+        return index
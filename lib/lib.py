@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
 #encoding: utf-8
+import os
 import csv
+import glob
 import json
 import datetime
 import argparse
 import copy
+import numbers
 import itertools
 import statistics
+import multiprocessing
 from io import BytesIO
 import xml.etree.ElementTree as ET
 ET.register_namespace("", "http://www.w3.org/2000/svg")
@@ -22,6 +26,13 @@ from pandas.plotting import register_matplotlib_converters
 register_matplotlib_converters()
 matplotlib.rcParams["figure.figsize"] = (27, 9)
 
+from .cache import Cache, DIRECTORY_PATTERN, directory_files
+from .slope import count_slopes, select_slope, parallel_select_slopes
+from .bootstrap import cor_bootstrap
+from .scan import error_scan
+from .shared import SharedArrays, attach
+from .decimate import MinMaxPyramid
+
 TIME = "time"
 MAX_TEMPERATURE = "max_temperature"
 MAX_POS_X = "max_pos_x"
@@ -30,6 +41,12 @@ MIN_TEMPERATURE = "min_temperature"
 MIN_POS_X = "min_pos_x"
 MIN_POS_Y = "min_pos_y"
 DISTANCE = "distance"
+SPEED = "speed"
+PATH_LENGTH = "path_length"
+HEADING = "heading"
+IMMOBILE = "immobile"
+MINUTE_OF_DAY = "minute_of_day"
+COUNT = "count"
 
 MEAN_SUFFIX = "_mean"
 MAX_TEMPERATURE_MEAN = MAX_TEMPERATURE + MEAN_SUFFIX
@@ -62,15 +79,62 @@ TEMPERATURE_ERROR_DATA = "temperature_error_data"
 WELCH_P_VALUE = "welch_p_value"
 ERROR_VALUE = "error_value"
 COR_ERROR_VALUE = "cor_error_value"
+TARGET = "target"
+SWEEP_PARAMETERS = ["step_size", "thres_sd_heat", "welch_thres", "sd_num", "error_step"]
 
 SD_NUM = 1.5
+# columns scored by the temperature part, profiled in one bucketed pass
+TEMPERATURE_COLUMNS = [MAX_TEMPERATURE, MIN_TEMPERATURE]
+WINDOW_COLUMNS = [MAX_TEMPERATURE, MAX_POS_X, MAX_POS_Y, MIN_TEMPERATURE, MIN_POS_X, MIN_POS_Y, DISTANCE]
+FEATURES = [DISTANCE, SPEED, PATH_LENGTH, HEADING, IMMOBILE]
+FEATURES_DTYPE = {
+    DISTANCE: np.float32,
+    SPEED: np.float32,
+    PATH_LENGTH: np.float64,
+    HEADING: np.float32,
+    IMMOBILE: bool,
+}
+# steps up to this many pixels count as not moving
+IMMOBILE_THRES = 1.0
 CACHE_DIR = "./cache"
+CHUNK_SIZE = 100000
+
+A3_TIME_FORMAT = "%Y/%m/%d %H:%M:%S"
+
+COLUMNS = [TIME, MAX_TEMPERATURE, MAX_POS_X, MAX_POS_Y, MIN_TEMPERATURE, MIN_POS_X, MIN_POS_Y]
+COLUMNS_DTYPE = {
+    TIME: str,
+    MAX_TEMPERATURE: np.float32,
+    MAX_POS_X: np.int16,
+    MAX_POS_Y: np.int16,
+    MIN_TEMPERATURE: np.float32,
+    MIN_POS_X: np.int16,
+    MIN_POS_Y: np.int16,
+}
+
+# csv layout of each camera logger
+SCHEMAS = {
+    "a3": {
+        "names": COLUMNS,
+        "dtype": COLUMNS_DTYPE,
+        "time_format": A3_TIME_FORMAT,
+    },
+    "lepton": {
+        "names": COLUMNS,
+        "dtype": COLUMNS_DTYPE,
+        "time_format": A3_TIME_FORMAT,
+    },
+}
 
 
 class Data(object):
     inner_data = None
     labels = {}
     auto_columns_rename = True
+    time_index_source = None
+    time_index_cache = None
+    pyramid_source = None
+    pyramid_cache = None
     
     def __init__(self, data=pd.DataFrame(), labels=None):
         if type(data) is pd.core.series.Series:
@@ -109,6 +173,39 @@ class Data(object):
     def query(self, query):
         return Data(self.inner_data.query(query))
 
+    def time_index(self):
+        # int64 ns epoch of the time column in ascending order, plus the row
+        # order when the frame is not sorted. rebuilt when inner_data is replaced
+        if self.time_index_source is not self.inner_data:
+            times = self.inner_data[TIME].to_numpy().astype("datetime64[ns]").view(np.int64)
+            sorter = None
+            if times.size > 1 and (times[1:] < times[:-1]).any():
+                sorter = np.argsort(times, kind="mergesort")
+                times = times[sorter]
+            self.time_index_cache = (times, sorter)
+            self.time_index_source = self.inner_data
+        return self.time_index_cache
+
+    def pyramid(self, x_col, y_col):
+        # min/max pyramid of y_col over x_col for drawing, built once per
+        # column pair and rebuilt when inner_data is replaced
+        if self.pyramid_source is not self.inner_data:
+            self.pyramid_cache = {}
+            self.pyramid_source = self.inner_data
+        key = (x_col, y_col)
+        if key not in self.pyramid_cache:
+            self.pyramid_cache[key] = MinMaxPyramid(self.inner_data[x_col].to_numpy(), self.inner_data[y_col].to_numpy())
+        return self.pyramid_cache[key]
+
+    def time_slice(self, start, end):
+        # rows with start < time < end, the same range as timerange_to_query
+        times, sorter = self.time_index()
+        i = np.searchsorted(times, pd.Timestamp(start).value, side="right")
+        j = np.searchsorted(times, pd.Timestamp(end).value, side="left")
+        if sorter is None:
+            return Data(self.inner_data.iloc[i:j])
+        return Data(self.inner_data.iloc[np.sort(sorter[i:j])])
+
     def sort(self, key):
         self.inner_data = self.inner_data.sort_values(key)
 
@@ -162,6 +259,10 @@ class Data(object):
     def append(self, data):
         self.inner_data = pd.concat([self.inner_data, data.inner_data])
 
+    @staticmethod
+    def builder(labels=None, capacity=1024):
+        return DataBuilder(labels, capacity)
+
     def split(self, step):
         l = self.inner_data
         for idx in range(0, len(l), step):
@@ -174,7 +275,7 @@ class Data(object):
         pass
 
     def save_csv(self, filename):
-        self.inner_data
+        self.inner_data.to_csv(filename, index=False)
 
     def gen_labels(self):
         labels = {}
@@ -210,22 +311,142 @@ class Data(object):
         return self.inner_data.__str__()
 
 
+class DataBuilder(object):
+    # columnar buffer growing by doubling, so appending n rows is amortized O(n).
+    # rows appended one by one need the labels, extend takes them from the frame
+    def __init__(self, labels=None, capacity=1024):
+        self.labels = labels
+        self.capacity = capacity
+        self.columns = {}
+        self.size = 0
+
+    def _allocate(self, dtypes):
+        for name, dtype in zip(self.labels, dtypes):
+            self.columns[name] = np.empty(self.capacity, dtype=dtype)
+
+    def _reserve(self, end):
+        if end <= self.capacity:
+            return
+        self.capacity = max(end, self.capacity * 2)
+        for name, array in self.columns.items():
+            grown = np.empty(self.capacity, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            self.columns[name] = grown
+
+    def append(self, row):
+        if self.labels is None:
+            raise ValueError("labels are required to append rows")
+        if len(row) != len(self.labels):
+            raise ValueError("row has %d values for %d labels" % (len(row), len(self.labels)))
+        if not self.columns:
+            self._allocate([_infer_dtype(value) for value in row])
+        self._reserve(self.size + 1)
+        for array, value in zip(self.columns.values(), row):
+            if array.dtype.kind == "M":
+                value = pd.Timestamp(value).to_datetime64()
+            array[self.size] = value
+        self.size += 1
+
+    def extend(self, data):
+        df = data.inner_data if isinstance(data, Data) else data
+        n = len(df)
+        if not self.columns:
+            if self.labels is None:
+                self.labels = list(df.columns)
+            self.capacity = max(self.capacity, n)
+            self._allocate([df[name].dtype for name in self.labels])
+        end = self.size + n
+        self._reserve(end)
+        for name, array in self.columns.items():
+            array[self.size:end] = df[name].to_numpy()
+        self.size = end
+
+    def last(self, name):
+        return self.columns[name][self.size-1]
+
+    def build(self):
+        if not self.columns:
+            return Data(pd.DataFrame(columns=self.labels))
+        columns = {name: array[:self.size] for name, array in self.columns.items()}
+        return Data(pd.DataFrame(columns, copy=False))
+
+
+def _infer_dtype(value):
+    if isinstance(value, (datetime.datetime, np.datetime64)) or value is pd.NaT:
+        return np.dtype("datetime64[ns]")
+    if isinstance(value, numbers.Number):
+        return np.dtype(np.float64)
+    return np.dtype(object)
+
+
 class Loader(object):
     preprocess = None
     use_pandas = True
     use_index = False
  
-    def __init__(self, filename, sep=",", header=None, names=None):
+    def __init__(self, filename, sep=",", header=None, names=None, dtype=None, time_format=None, format=None):
+        if format:
+            schema = SCHEMAS[format]
+            names = names or schema["names"]
+            dtype = dtype or schema["dtype"]
+            time_format = time_format or schema["time_format"]
         self.sep = sep
         self.header = header
         self.filename = filename
         self.names = names
+        self.dtype = dtype
+        self.time_format = time_format
+        self.format = format
+        self.offset = 0
+        self.inode = None
+        self.builder = None
 
     def load(self):
         data = self._load()
+        return Data(self._prepare(data))
+
+    def iter_load(self, chunksize=CHUNK_SIZE):
+        reader = pd.read_csv(self.filename, sep=self.sep, header=self.header, names=self.names, dtype=self.dtype, chunksize=chunksize)
+        for data in reader:
+            yield Data(self._prepare(data))
+
+    def follow(self):
+        # parses only the complete lines appended since the previous call. a
+        # file that got shorter or was replaced (truncated or rotated) is read
+        # again from the start, header included, and the rows so far dropped
+        with open(self.filename, "rb") as f:
+            st = os.fstat(f.fileno())
+            if st.st_size < self.offset or (self.inode is not None and st.st_ino != self.inode):
+                self.offset = 0
+                self.builder = None
+            self.inode = st.st_ino
+            f.seek(self.offset)
+            buf = f.read()
+        end = buf.rfind(b"\n") + 1
+        if self.builder is None:
+            self.builder = DataBuilder()
+        if end == 0:
+            return self.builder.build()
+
+        header = self.header if self.offset == 0 else None
+        df = pd.read_csv(BytesIO(buf[:end]), sep=self.sep, header=header, names=self.names, dtype=self.dtype)
+        self.offset += end
+        if df.empty:
+            return self.builder.build()
+
+        last = None
+        if self.builder.size:
+            last = tuple(self.builder.last(name) for name in [MAX_POS_X, MAX_POS_Y, TIME, PATH_LENGTH])
+        data = calc_minute_of_day(calc_features(Data(self._prepare(df)), last=last))
+        self.builder.extend(data.inner_data)
+        return self.builder.build()
+
+    def _prepare(self, data):
+        if self.time_format:
+            data = parse_time(data, self.time_format)
         if self.preprocess and callable(self.preprocess):
             data = self.preprocess(data)
-        return Data(data)
+        return data
 
     def set_preprocess(self, func):
         if callable(func) == False:
@@ -235,7 +456,7 @@ class Loader(object):
     def _load(self):
         if self.use_pandas:
             index_col = 0 if self.use_index else None
-            df = pd.read_csv(self.filename, sep=self.sep, index_col=index_col, header=self.header, names=self.names)
+            df = pd.read_csv(self.filename, sep=self.sep, index_col=index_col, header=self.header, names=self.names, dtype=self.dtype)
             return df
         else:
             datas = []
@@ -246,101 +467,391 @@ class Loader(object):
             return datas
 
 
-def a3_preprocess(data):
-    data[TIME] = data[TIME].apply(lambda x: datetime.datetime.strptime(x, "%Y/%m/%d %H:%M:%S"))
+def parse_time(data, time_format):
+    data[TIME] = pd.to_datetime(data[TIME], format=time_format).astype("datetime64[ns]")
     return data
 
+def a3_preprocess(data):
+    return parse_time(data, A3_TIME_FORMAT)
+
 def lepton_preprocess(data):
     data[TIME] = data[TIME].apply(lambda x: datetime.datetime(x))
     return data
 
-def calc_distance(data):
-    x1 = data.get_col(MAX_POS_X)
-    x2 = x1.shift(periods=1, fill_value=x1[0])
-    y1 = data.get_col(MAX_POS_Y)
-    y2 = y1.shift(periods=1, fill_value=y1[0])
-    distance = Data( ((x1-x2)**2 + (y1-y2)**2)**0.5, labels=[DISTANCE])
-    joined_data = data.join(distance)
-    return joined_data
+def calc_features(data, features=FEATURES, last=None, positions=(MAX_POS_X, MAX_POS_Y), prefix="", immobile_thres=IMMOBILE_THRES):
+    # step distance, speed (pixels per second), cumulative path length,
+    # heading (radians) and immobility of one position track, written into
+    # the frame in one pass. last is last_features() of the previous chunk
+    df = data.inner_data
+    x = df[positions[0]].to_numpy(dtype=np.float32)
+    y = df[positions[1]].to_numpy(dtype=np.float32)
+    if x.size == 0:
+        for name in features:
+            df[prefix + name] = np.empty(0, dtype=FEATURES_DTYPE[name])
+        return data
+    if last is None:
+        last = (x[0], y[0], None, 0.0)
+    last_x, last_y, last_time, last_length = last
+
+    dx = np.diff(x, prepend=np.float32(last_x))
+    dy = np.diff(y, prepend=np.float32(last_y))
+    distance = np.sqrt(dx*dx + dy*dy)
+    values = {DISTANCE: lambda: distance}
+
+    def speed():
+        t = df[TIME].to_numpy().astype("datetime64[ns]").view(np.int64)
+        previous = t[0] if last_time is None else pd.Timestamp(last_time).value
+        dt = np.diff(t, prepend=previous) / 1e9
+        return np.divide(distance, dt, out=np.zeros(distance.size), where=dt > 0)
+    values[SPEED] = speed
+    values[PATH_LENGTH] = lambda: last_length + np.cumsum(distance, dtype=np.float64)
+    values[HEADING] = lambda: np.where(distance > 0, np.arctan2(dy, dx), np.nan)
+    values[IMMOBILE] = lambda: distance <= immobile_thres
+
+    for name in features:
+        df[prefix + name] = values[name]().astype(FEATURES_DTYPE[name], copy=False)
+    return data
 
-def timerange_to_query(init_datetime, end_datetime, field_name=TIME):
-    return init_datetime.strftime("%Y%m%d%H%M%S") +  ' < ' + field_name + ' < ' + end_datetime.strftime("%Y%m%d%H%M%S")
+def last_features(data, positions=(MAX_POS_X, MAX_POS_Y), prefix=""):
+    df = data.inner_data
+    length = df[prefix + PATH_LENGTH].iloc[-1] if prefix + PATH_LENGTH in df.columns else 0.0
+    return (df[positions[0]].iloc[-1], df[positions[1]].iloc[-1], df[TIME].iloc[-1], length)
+
+def iter_calc_features(chunks, features=FEATURES):
+    # the first row of a chunk moves from the last row of the previous one
+    last = None
+    for data in chunks:
+        if data.inner_data.empty:
+            continue
+        data = calc_features(data, features, last)
+        last = last_features(data)
+        yield data
+
+def calc_distance(data, last_pos=None):
+    last = None if last_pos is None else (last_pos[0], last_pos[1], None, 0.0)
+    return calc_features(data, [DISTANCE], last)
+
+def _load_frame(filename, format):
+    return Loader(filename, format=format).load().inner_data
+
+def load_directory(dirname, format="a3", pattern=DIRECTORY_PATTERN, max_workers=None, executor=None):
+    # files are parsed in the given executor, or in a pool of spawned
+    # processes, since forking the threads of the GUI is unsafe
+    filenames = directory_files(dirname, pattern)
+    if not filenames:
+        raise FileNotFoundError("no files matching %s in %s" % (pattern, dirname))
+    if executor is not None:
+        frames = list(executor.map(_load_frame, filenames, itertools.repeat(format)))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            frames = list(executor.map(_load_frame, filenames, itertools.repeat(format)))
+    if all(df.empty for df in frames):
+        # keeps the columns of the format
+        return Data(frames[0])
+    frames = [df for df in frames if not df.empty]
+
+    # files are ordered by their first sample and copied once
+    frames.sort(key=lambda df: df[TIME].iloc[0])
+    df = pd.concat(frames, ignore_index=True)
+    if not df[TIME].is_monotonic_increasing:
+        df = df.sort_values(TIME, kind="mergesort", ignore_index=True)
+    df = df.drop_duplicates(subset=TIME, keep="first", ignore_index=True)
+    return Data(df)
+
+def load_data(filename, format="a3", use_cache=False):
+    cache = Cache(CACHE_DIR) if use_cache else None
+    if cache:
+        df = cache.get(filename, format)
+        if df is not None:
+            return Data(df)
+
+    if os.path.isdir(filename):
+        data = load_directory(filename, format)
+    else:
+        loader = Loader(filename, format=format)
+        data = loader.load()
+    data = calc_features(data)
+    data = calc_minute_of_day(data)
 
-def date_window_separate(data, window_size):
-    data_window = Data()
-    for d in data.split(window_size):
-        d_time_mean = d.get_col(TIME).mean()
-        d_time_mean_data = Data(d_time_mean, labels=[TIME])
-        d_data = d[[MAX_TEMPERATURE, MAX_POS_X, MAX_POS_Y, MIN_TEMPERATURE, MIN_POS_X, MIN_POS_Y, DISTANCE]]
-        d_data_mean = d_data.mean()
-        d_data_std = d_data.std()
-        data_ = d_time_mean_data.join(d_data_mean).join(d_data_std)
-        data_window.append(data_)
-    data_window.reset_index()
-
-def temperature_process(data, bg_init_time, bg_end_time, tg_init_time, tg_end_time, step_size=8, thres_sd_heat=1.5, save_svg=False, show_graph=False, svg_filepath="temperature.svg"):
-    bg = data.query(timerange_to_query(bg_init_time, bg_end_time))
-    tg = data.query(timerange_to_query(tg_init_time, tg_end_time))
+    if cache:
+        cache.put(filename, format, data.inner_data)
+    return data
 
-    print(bg)
-    print(tg)
+def clear_cache(filename=None):
+    Cache(CACHE_DIR).invalidate(filename)
 
-    bg_preprocess_data = Data()
-    temperature_error_data = Data()
+def calc_minute_of_day(data):
+    data.inner_data[MINUTE_OF_DAY] = minute_of_day(data)
+    return data
 
-    if True:
-        t = datetime.time(hour=0, minute=0, second=0)
-        delta = datetime.timedelta(minutes=step_size)
-        today = datetime.date.today()
-        dt = datetime.datetime.combine(today, t)
-        while(dt.date() == today):
-            bg_between_time = bg.between_time(dt.time(), (dt+delta).time())
-            bg_between_time_time = Data(bg_between_time.get_col(TIME).mean(), labels=[TIME])
-            bg_between_time_mean = bg_between_time[[MAX_TEMPERATURE, MIN_TEMPERATURE, DISTANCE]].mean()
-            bg_between_time_std = bg_between_time[[MAX_TEMPERATURE, MIN_TEMPERATURE, DISTANCE]].std()
-            bg_preprocess_data.append(bg_between_time_time.join(bg_between_time_mean).join(bg_between_time_std))
+def minute_of_day(data):
+    if MINUTE_OF_DAY in data.inner_data.columns:
+        return data.get_col(MINUTE_OF_DAY).to_numpy()
+    times = data.get_col(TIME).to_numpy().astype("datetime64[ns]")
+    return (times - times.astype("datetime64[D]")).astype("timedelta64[m]").astype(np.int16)
+
+def time_of_day_bucket(data, step_size):
+    return minute_of_day(data) // step_size
+
+def time_of_day_buckets(step_size):
+    return -(-24*60 // step_size)
+
+def time_of_day_profile(data, step_size, columns):
+    # count, mean and std of each column per step_size minutes bucket of the
+    # day. row i of the result is bucket i
+    bucket = time_of_day_bucket(data, step_size)
+    n_buckets = time_of_day_buckets(step_size)
+    count = np.bincount(bucket, minlength=n_buckets)
+    profile = {COUNT: count}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for c in columns:
+            values = data.get_col(c).to_numpy(dtype=np.float64)
+            mean = np.bincount(bucket, weights=values, minlength=n_buckets) / count
+            deviation = values - mean[bucket]
+            var = np.bincount(bucket, weights=deviation**2, minlength=n_buckets) / (count - 1)
+            var[count < 2] = np.nan
+            profile[c+MEAN_SUFFIX] = mean
+            profile[c+STD_SUFFIX] = np.sqrt(var)
+    return Data(pd.DataFrame(profile))
 
-            bg_mean = bg_between_time_mean.get_col(MAX_TEMPERATURE_MEAN)[0]
-            bg_std = bg_between_time_std.get_col(MAX_TEMPERATURE_STD)[0]
+def timerange_to_query(init_datetime, end_datetime, field_name=TIME):
+    return init_datetime.strftime("%Y%m%d%H%M%S") +  ' < ' + field_name + ' < ' + end_datetime.strftime("%Y%m%d%H%M%S")
 
-            for index, bg_data in bg_between_time.inner_data.iterrows():
-                temperature_error_data.append(Data([bg_data[TIME], np.abs(bg_data[MAX_TEMPERATURE] - bg_mean)/bg_std], labels=[TIME, TEMPERATURE_ERROR_DATA]))
+def date_window_separate(data, window_size):
+    return window_process(data, window_size)
+
+def temperature_error_value(error, thres_sd_heat):
+    with np.errstate(invalid="ignore"):
+        return error_scan(error > thres_sd_heat, (error / thres_sd_heat) * 0.1, decrement=0.5, floor=0)
+
+def distance_error_value(p_value, welch_thres):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return error_scan(p_value < welch_thres, -0.1 * np.log10(p_value), decrement=1.0, floor=0)
+
+def cor_error_value(excess, error_step):
+    # error_step + 1 quiet windows in a row reset the value
+    return error_scan(excess > 0, excess, reset_after=error_step)
+
+class BaselineModel(object):
+    # background statistics fitted once from the bg range: per bucket profile
+    # of temperature and distance, and the Passing-Bablok fit of the bg
+    # windows. scoring a target range never touches the bg rows again
+    PARTS = ["temperature", "distance", "cor"]
+
+    def __init__(self, bg_init_time=None, bg_end_time=None, step_size=8, window_size=8):
+        self.bg_init_time = bg_init_time
+        self.bg_end_time = bg_end_time
+        self.step_size = step_size
+        self.window_size = window_size
+        self.profile = None
+        self.cor = None
+
+    @staticmethod
+    def fit(data, bg_init_time, bg_end_time, step_size=8, window_size=8, parts=PARTS, multi_thread=False, max_workers=None, window=None):
+        # window is window_process(data, window_size) when the caller has it
+        model = BaselineModel(bg_init_time, bg_end_time, step_size, window_size)
+        columns = []
+        if "temperature" in parts:
+            columns.extend(TEMPERATURE_COLUMNS)
+        if "distance" in parts:
+            columns.append(DISTANCE)
+        if columns:
+            model.fit_profile(data.time_slice(bg_init_time, bg_end_time), columns)
+        if "cor" in parts:
+            if window is None:
+                window = window_process(data, window_size)
+            model.fit_cor(window.time_slice(bg_init_time, bg_end_time), multi_thread=multi_thread, max_workers=max_workers)
+        return model
+
+    def fit_profile(self, bg, columns):
+        # bg are the raw rows of the background range
+        self.profile = time_of_day_profile(bg, self.step_size, columns)
+
+    def fit_cor(self, bg_window, multi_thread=False, max_workers=None):
+        # bg_window are the windows of window_size rows in the background range
+        # windows without movement (log2 of a zero distance) are left out, as
+        # in passing_bablock
+        with np.errstate(divide="ignore"):
+            bg_distance = np.log2(bg_window.get_col(DISTANCE_MEAN).to_numpy(dtype=np.float64))
+        bg_temperature = bg_window.get_col(MAX_TEMPERATURE_MEAN).to_numpy(dtype=np.float64)
+        finite = np.isfinite(bg_distance) & np.isfinite(bg_temperature)
+        bg_distance = bg_distance[finite]
+        bg_temperature = bg_temperature[finite]
+        slope, sec, upper, lower = passing_bablock(bg_distance, bg_temperature, multi_thread=multi_thread, max_workers=max_workers)
+        side = (bg_temperature  - (bg_distance * slope + sec))/((1+slope**2)**0.5)
+        self.cor = {
+            "slope": slope, "n": sec, "upper": upper, "lower": lower, "side_std": side.std(ddof=1),
+            "distance": bg_distance, "temperature": bg_temperature,
+        }
+
+    def has(self, part):
+        if part == "temperature":
+            return self.has_profile([MAX_TEMPERATURE])
+        if part == "distance":
+            return self.has_profile([DISTANCE])
+        return self.cor is not None
+
+    def has_profile(self, columns):
+        return self.profile is not None and all(c+MEAN_SUFFIX in self.profile.inner_data.columns for c in columns)
+
+    def temperature_errors(self, data, columns=TEMPERATURE_COLUMNS):
+        # distance of every row from its bucket mean in bucket stds, one row
+        # per column. the buckets are looked up once for all columns
+        bucket = time_of_day_bucket(data, self.step_size)
+        error = np.empty((len(columns), len(data.inner_data)))
+        for i, column in enumerate(columns):
+            mean = self.profile.get_col(column+MEAN_SUFFIX).to_numpy()
+            std = self.profile.get_col(column+STD_SUFFIX).to_numpy()
+            # buckets with a zero or nan std give inf or nan without a warning
+            with np.errstate(divide="ignore", invalid="ignore"):
+                error[i] = np.abs(data.get_col(column).to_numpy() - mean[bucket])/std[bucket]
+        return error
+
+    def temperature_error(self, data, column=MAX_TEMPERATURE):
+        error = self.temperature_errors(data, [column])[0]
+        return Data(pd.DataFrame({TIME: data.get_col(TIME).to_numpy(), TEMPERATURE_ERROR_DATA: error}))
+
+    def welch(self, tg, tg_init_time):
+        # every (target day, time of day bucket) cell against the same bucket
+        # of the background
+        bg_count = self.profile.get_col(COUNT).to_numpy()
+        bg_mean = self.profile.get_col(DISTANCE_MEAN).to_numpy()
+        bg_var = self.profile.get_col(DISTANCE_STD).to_numpy()**2
+
+        n_buckets = time_of_day_buckets(self.step_size)
+        bucket = time_of_day_bucket(tg, self.step_size)
+        offset = tg.get_col(TIME).to_numpy().astype("datetime64[ns]").view(np.int64) - pd.Timestamp(tg_init_time).value
+        day = offset // (24*60*60*10**9)
+        cell = day * n_buckets + bucket
+
+        n_cells = int(cell.max()) + 1 if cell.size else 0
+        distance = tg.get_col(DISTANCE).to_numpy(dtype=np.float64)
+        tg_count = np.bincount(cell, minlength=n_cells)
+        used = tg_count > 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            tg_mean = np.bincount(cell, weights=distance, minlength=n_cells) / tg_count
+            deviation = distance - tg_mean[cell]
+            tg_var = np.bincount(cell, weights=deviation**2, minlength=n_cells) / (tg_count - 1)
+            tg_var[tg_count < 2] = np.nan
+            tg_time = np.bincount(cell, weights=offset, minlength=n_cells) / tg_count
+
+        cell_bucket = np.arange(n_cells)[used] % n_buckets
+        p_value = welch_ttest(tg_mean[used], tg_var[used], tg_count[used], bg_mean[cell_bucket], bg_var[cell_bucket], bg_count[cell_bucket])
+        time = (pd.Timestamp(tg_init_time).value + np.round(tg_time[used]).astype(np.int64)).astype("datetime64[ns]")
+
+        welch_data = Data(pd.DataFrame({TIME: time, WELCH_P_VALUE: p_value}))
+        welch_data.sort(TIME)
+        welch_data.reset_index()
+        return welch_data
+
+    def band(self, SD_NUM=SD_NUM):
+        d2 = self.cor["side_std"]*SD_NUM
+        sec = self.cor["n"]
+        slope = self.cor["slope"]
+        return sec + d2*(1+slope**2)**0.5, sec - d2*(1+slope**2)**0.5
+
+    def cor_excess(self, tg_distance, tg_temperature, SD_NUM=SD_NUM):
+        # distance of every target window outside the band, 0 inside it
+        slope = self.cor["slope"]
+        n_plus, n_minus = self.band(SD_NUM)
+        norm = (1+slope**2)**0.5
+        tg_x = np.asarray(tg_distance, dtype=np.float64)
+        tg_y = np.asarray(tg_temperature, dtype=np.float64)
+        with np.errstate(invalid="ignore"):
+            upper_excess = (tg_y - (tg_x*slope + n_plus)) / norm
+            lower_excess = ((tg_x*slope + n_minus) - tg_y) / norm
+            return np.where(upper_excess > 0, upper_excess, np.where(lower_excess > 0, lower_excess, 0.0))
+
+    def score(self, data, tg_init_time, tg_end_time, thres_sd_heat=1.5, welch_thres=0.5, ERROR_STEP=1, SD_NUM=SD_NUM):
+        # error series of every fitted part over one target range
+        result = {}
+        tg = data.time_slice(tg_init_time, tg_end_time)
+        # the temperature series are keyed by their column
+        columns = [c for c in TEMPERATURE_COLUMNS if self.has_profile([c])]
+        if columns:
+            scores = temperature_scores(self, [tg], thres_sd_heat, columns)
+            for column in columns:
+                result[column] = scores[column][0]
+        if self.has("distance"):
+            result["distance"], _ = distance_scores(self, tg, tg_init_time, welch_thres)
+        if self.has("cor"):
+            tg_window = window_process(data, self.window_size).time_slice(tg_init_time, tg_end_time)
+            result["cor"] = cor_scores(self, tg_window, ERROR_STEP, SD_NUM)
+        return result
+
+    def save(self, filename):
+        arrays = {
+            "bg_init_time": np.datetime64(self.bg_init_time, "ns") if self.bg_init_time is not None else np.datetime64("NaT", "ns"),
+            "bg_end_time": np.datetime64(self.bg_end_time, "ns") if self.bg_end_time is not None else np.datetime64("NaT", "ns"),
+            "step_size": self.step_size,
+            "window_size": self.window_size,
+        }
+        if self.profile is not None:
+            for name in self.profile.inner_data.columns:
+                arrays["profile/" + name] = self.profile.get_col(name).to_numpy()
+        if self.cor is not None:
+            for name, value in self.cor.items():
+                arrays["cor/" + name] = value
+        with open(filename, "wb") as f:
+            np.savez(f, **arrays)
+
+    @staticmethod
+    def load(filename):
+        with np.load(filename, allow_pickle=False) as f:
+            def time(name):
+                value = f[name][()]
+                return None if np.isnat(value) else pd.Timestamp(value).to_pydatetime()
+            model = BaselineModel(time("bg_init_time"), time("bg_end_time"), int(f["step_size"]), int(f["window_size"]))
+            profile = {name[len("profile/"):]: f[name] for name in f.files if name.startswith("profile/")}
+            if profile:
+                model.profile = Data(pd.DataFrame(profile))
+            cor = {name[len("cor/"):]: f[name] for name in f.files if name.startswith("cor/")}
+            if cor:
+                model.cor = {name: value if value.ndim else value.item() for name, value in cor.items()}
+        return model
+
+def model_size(model, name, size):
+    # step_size or window_size of a passed in model. a size given by the
+    # caller, None for any, has to be the one the model was fitted with
+    fitted = getattr(model, name)
+    if size is not None and size != fitted:
+        raise ValueError("%s %s differs from the %s %s of the model" % (name, size, name, fitted))
+    return fitted
+
+def model_part(model, part, column=None):
+    # a passed in model has to be fitted with the part a process scores, for
+    # temperature with the profile of the scored column
+    fitted = model.has(part) if column is None else model.has_profile([column])
+    if not fitted:
+        raise ValueError("the model has no %s part" % (column or part))
+
+def temperature_process(data, bg_init_time, bg_end_time, tg_init_time, tg_end_time, step_size=None, thres_sd_heat=1.5, save_svg=False, show_graph=False, svg_filepath="temperature.svg", model=None, column=MAX_TEMPERATURE):
+    bg = data.time_slice(bg_init_time, bg_end_time)
+    tg = data.time_slice(tg_init_time, tg_end_time)
 
-            tg_between_time = tg.between_time(dt.time(), (dt+delta).time())
-            for index, tg_data in tg_between_time.inner_data.iterrows():
-                temperature_error_data.append(Data([tg_data[TIME], np.abs(tg_data[MAX_TEMPERATURE] - bg_mean)/bg_std], labels=[TIME, TEMPERATURE_ERROR_DATA]))
+    print(bg)
+    print(tg)
 
-            dt += delta
-        bg_preprocess_data.reset_index()
-        temperature_error_data.sort(TIME)
-        temperature_error_data.reset_index()
+    if model is None:
+        model = BaselineModel.fit(data, bg_init_time, bg_end_time, step_size=step_size or 8, parts=["temperature"])
+    else:
+        model_size(model, "step_size", step_size)
+        model_part(model, "temperature", column)
 
+    error_data, temperature_error_data = temperature_scores(model, [bg, tg], thres_sd_heat, [column])[column]
     print(temperature_error_data)
 
-    error_data = Data()
-    error_value = 0
-    for index, data in temperature_error_data.inner_data.iterrows():
-        time = data[TIME]
-        if data[TEMPERATURE_ERROR_DATA] > thres_sd_heat:
-            error_value += (data[TEMPERATURE_ERROR_DATA] / thres_sd_heat) * 0.1
-        else:
-            error_value -= 0.5
-            if error_value < 0:
-                error_value = 0
-        error_data.append(Data([time, error_value], labels=[TIME, TEMPERATURE_ERROR_DATA]))
-    error_data.reset_index()
-
     if show_graph or save_svg:
         fig = plt.figure()
         ax1 = fig.add_subplot(111)
 
         time = bg.get_col(TIME)
-        temperature = bg.get_col(MAX_TEMPERATURE)
+        temperature = bg.get_col(column)
         min_time = min(time)
         ax1.plot(time, temperature)
 
         time = tg.get_col(TIME)
-        temperature = tg.get_col(MAX_TEMPERATURE)
+        temperature = tg.get_col(column)
         max_time = max(time)
         ax1.plot(time, temperature)
 
@@ -359,71 +870,46 @@ def temperature_process(data, bg_init_time, bg_end_time, tg_init_time, tg_end_ti
 
     return (error_data, temperature_error_data)
 
-def distance_process(data, bg_init_time, bg_end_time, tg_init_time, tg_end_time, step_size=8, welch_thres=0.5, show_graph=False, save_svg=True, svg_filepath="distance.svg"):
+def temperature_scores(model, frames, thres_sd_heat=1.5, columns=TEMPERATURE_COLUMNS):
+    # error series over the rows of all frames in time order, and the z
+    # scores it is built from, per column. all columns share the bucket
+    # lookup and go through error_scan as one batch
+    time, error = temperature_z_scores(model, frames, columns)
+    error_value = temperature_error_value(error, thres_sd_heat)
+
+    scores = {}
+    for i, column in enumerate(columns):
+        temperature_error_data = Data(pd.DataFrame({TIME: time, TEMPERATURE_ERROR_DATA: error[i]}))
+        error_data = Data(pd.DataFrame({TIME: time, TEMPERATURE_ERROR_DATA: error_value[i]}))
+        scores[column] = (error_data, temperature_error_data)
+    return scores
+
+def temperature_z_scores(model, frames, columns=TEMPERATURE_COLUMNS):
+    # time of the rows of all frames in time order, and their z scores as a
+    # (columns x rows) array
+    time = np.concatenate([d.get_col(TIME).to_numpy() for d in frames])
+    error = np.concatenate([model.temperature_errors(d, columns) for d in frames], axis=1)
+    order = np.argsort(time, kind="stable")
+    return time[order], error[:, order]
+
+def distance_process(data, bg_init_time, bg_end_time, tg_init_time, tg_end_time, step_size=None, welch_thres=0.5, show_graph=False, save_svg=True, svg_filepath="distance.svg", model=None):
     print("bg_init_time", bg_init_time)
     print("bg_end_time",  bg_end_time)
     print("tg_init_time", tg_init_time)
     print("tg_end_time",  tg_end_time)
-    data_window = Data()
-    for d in data.split(step_size):
-        d_time_mean = d.get_col(TIME).mean()
-        d_time_mean_data = Data(d_time_mean, labels=[TIME])
-        d_data = d[[MAX_TEMPERATURE, MAX_POS_X, MAX_POS_Y, MIN_TEMPERATURE, MIN_POS_X, MIN_POS_Y, DISTANCE]]
-        d_data_mean = d_data.mean()
-        d_data_std = d_data.std()
-        data_ = d_time_mean_data.join(d_data_mean).join(d_data_std)
-        data_window.append(data_)
-    data_window.reset_index()
-
-    data_window_time = data_window.get_col(TIME)
-    data_window_distance_mean = data_window.get_col(DISTANCE_MEAN)
-    data_window_max_temperature_mean = data_window.get_col(MAX_TEMPERATURE_MEAN)
-    data_window_min_temperature_mean = data_window.get_col(MIN_TEMPERATURE_MEAN)
-
-    bg = data.query(timerange_to_query(bg_init_time, bg_end_time))
-    tg = data.query(timerange_to_query(tg_init_time, tg_end_time))
+    bg = data.time_slice(bg_init_time, bg_end_time)
+    tg = data.time_slice(tg_init_time, tg_end_time)
 
     print(bg)
     print(tg)
 
-    welch_data = Data()
-    if True:
-        t = datetime.time(hour=0, minute=0, second=0)
-        delta = datetime.timedelta(minutes=step_size)
-        today = datetime.date.today()
-        dt = datetime.datetime.combine(today, t)
-
-        while(dt.date() == today):
-            bg_between_time = bg.between_time(dt.time(), (dt+delta).time())
-            tg_between_time = tg.between_time(dt.time(), (dt+delta).time())
-            diff = (tg_end_time - tg_init_time).days + 1
-            for i in range(diff):
-                target = tg_between_time.query(timerange_to_query(tg_init_time+datetime.timedelta(days=i), tg_init_time+datetime.timedelta(days=i+1)))
-                if target.isempty():
-                    pass
-                else:
-                    time = target.get_col(TIME).mean()
-                    print(target)
-                    _, p_value = stats.ttest_ind(target.inner_data[DISTANCE], bg_between_time.inner_data[DISTANCE], equal_var=False)
-                    welch_data.append(Data([time, p_value], labels=[TIME, WELCH_P_VALUE])) 
-            dt += delta
-        welch_data.sort(TIME)
-        welch_data.reset_index()
-        print(welch_data)
-
-    error_value = 0
-    error_data = Data()
-    for index, w_data in welch_data.inner_data.iterrows():
-        p = w_data[WELCH_P_VALUE]
-        time = w_data[TIME]
-        if p < welch_thres:
-            error_value += -0.1 * (np.log10(p))
-        else:
-            error_value -= 1.0
-            if error_value < 0:
-                error_value = 0
-        error_data.append(Data([time, error_value], labels=[TIME, ERROR_VALUE]))
-    error_data.reset_index()
+    if model is None:
+        model = BaselineModel.fit(data, bg_init_time, bg_end_time, step_size=step_size or 8, parts=["distance"])
+    else:
+        model_size(model, "step_size", step_size)
+        model_part(model, "distance")
+    error_data, welch_data = distance_scores(model, tg, tg_init_time, welch_thres)
+    print(welch_data)
     print(error_data)
 
     if show_graph or save_svg:
@@ -457,37 +943,90 @@ def distance_process(data, bg_init_time, bg_end_time, tg_init_time, tg_end_time,
 
     return (error_data, welch_data)
 
+def distance_scores(model, tg, tg_init_time, welch_thres=0.5):
+    welch_data = model.welch(tg, tg_init_time)
+    error_value = distance_error_value(welch_data.get_col(WELCH_P_VALUE).to_numpy(dtype=np.float64), welch_thres)
+    error_data = Data(pd.DataFrame({TIME: welch_data.get_col(TIME).to_numpy(), ERROR_VALUE: error_value}))
+    return (error_data, welch_data)
+
+
+def welch_ttest(mean1, var1, n1, mean2, var2, n2):
+    # two sided p values of Welch's t test from per group summary statistics,
+    # as stats.ttest_ind(equal_var=False): nan for a group of one row, 0 for
+    # two constant groups with different means
+    mean1, var1, n1, mean2, var2, n2 = (np.asarray(a, dtype=np.float64) for a in (mean1, var1, n1, mean2, var2, n2))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        v1 = var1 / n1
+        v2 = var2 / n2
+        t = (mean1 - mean2) / np.sqrt(v1 + v2)
+        df = (v1 + v2)**2 / (v1**2 / (n1 - 1) + v2**2 / (n2 - 1))
+        p_value = 2 * stats.t.sf(np.abs(t), df)
+    return np.where(np.isinf(t), 0.0, p_value)
+
+def passing_bablock(x_data, y_data, multi_thread=False, exact=False, max_workers=None):
+    # slope ranks are selected from the implicit set of pairwise slopes, by
+    # inversion counting or, with multi_thread, by tiles counted in a process
+    # pool. the old path which lists and sorts every slope is the exact reference.
+    # points where x or y is not finite (log2 of a zero distance) are left out
+    # of the slopes, of n for the confidence ranks and of the intercept
+    if exact:
+        return passing_bablock_exact(x_data, y_data)
+    assert(x_data.size == y_data.size)
+    x = np.asarray(x_data, dtype=np.float64)
+    y = np.asarray(y_data, dtype=np.float64)
+    finite = np.isfinite(x) & np.isfinite(y)
+    x = x[finite]
+    y = y[finite]
+    n = x.size
+
+    # slopes below -1 are dropped from the bottom of the sorted list
+    def ranks(shift, total):
+        n_pb_list = total - shift
+        if n_pb_list == 0:
+            raise statistics.StatisticsError("no median for empty data")
+
+        def pb_list(index):
+            if index < 0:
+                index += n_pb_list
+            if not 0 <= index < n_pb_list:
+                raise IndexError("list index out of range")
+            return shift + index
+
+        c_alpha=(1-0.95/2)*np.sqrt(n*(n-1)*(2*n+5)/18)
+        m1=int(round((n_pb_list-c_alpha)/2))
+        m2=n_pb_list-m1+1
+        return [pb_list((n_pb_list-1) // 2), pb_list(n_pb_list // 2), pb_list(m2), pb_list(m1)]
+
+    if multi_thread:
+        slopes = parallel_select_slopes(x, y, ranks, bound=-1.0, max_workers=max_workers)
+    else:
+        rng = np.random.default_rng()
+        shift = count_slopes(x, y, hi=-1)
+        total = count_slopes(x, y)
+        wanted = ranks(shift, total)
+        selected = {rank: select_slope(x, y, rank, total=total, rng=rng) for rank in set(wanted)}
+        slopes = [selected[rank] for rank in wanted]
+    median_low, median_high, pb_upper, pb_lower = slopes
+
+    pb_coef = (median_low + median_high) / 2
+    sec = (y - x * pb_coef).mean()
 
-def passing_bablock(x_data, y_data, multi_thread=False):
+    return pb_coef, sec, pb_upper, pb_lower
+
+def passing_bablock_exact(x_data, y_data):
     assert(x_data.size == y_data.size)
     n = x_data.size
     ng_count = 0
     pb_list = []
 
-    if multi_thread:
-        # FIXME: bug don't working
-        def calc(itr):
-            x1, y1 = itr[0]
-            x2, y2 = itr[1]
-            #print(x1, y2, x2, y2)
-            if x1-x2 == 0:
-                return -1
-            slope = (y2 - y1)/(x2 - x1)
-            return slope
-
-        with ProcessPoolExecutor(max_workers=2) as excutor:
-            print('executor')
-            g = (((x_data[i], y_data[i]), (x_data[j], y_data[j])) for i, j in itertools.combinations(range(n), 2))
-            res = excutor.map(calc, g)
-    else:
-        for i, j in itertools.combinations(range(n), 2):
-            if i<j and x_data[i]-x_data[j] != 0:
-                slope = (y_data[i]-y_data[j]) / (x_data[i]-x_data[j])
-                pb_list.append(slope)
-                if slope < -1:
-                    ng_count += 1
-            else:
-                pass
+    for i, j in itertools.combinations(range(n), 2):
+        if i<j and x_data[i]-x_data[j] != 0:
+            slope = (y_data[i]-y_data[j]) / (x_data[i]-x_data[j])
+            pb_list.append(slope)
+            if slope < -1:
+                ng_count += 1
+        else:
+            pass
 
     shift = ng_count
     pb_list.sort()
@@ -507,57 +1046,39 @@ def passing_bablock(x_data, y_data, multi_thread=False):
 
     return pb_coef, sec, pb_upper, pb_lower
 
-def cor_process(data, bg_init_time, bg_end_time, tg_init_time, tg_end_time, step_size=8, ERROR_STEP=1, SD_NUM=1.5, svg_filepath="cor.svg", show_graph=False, save_svg=False):
-    data_window = Data(pd.DataFrame())
-    for d in data.split(step_size):
-        d_time_mean = d.get_col(TIME).mean()
-        d_time_mean_data = Data(d_time_mean, labels=[TIME])
-        d_data = d[[MAX_TEMPERATURE, MAX_POS_X, MAX_POS_Y, MIN_TEMPERATURE, MIN_POS_X, MIN_POS_Y, DISTANCE]]
-        d_data_mean = d_data.mean()
-        d_data_std = d_data.std()
-        data_ = d_time_mean_data.join(d_data_mean).join(d_data_std)
-        data_window.append(data_)
-    data_window.reset_index()
-
-    bg = data_window.query(timerange_to_query(bg_init_time, bg_end_time))
-    tg = data_window.query(timerange_to_query(tg_init_time, tg_end_time))
+def cor_process(data, bg_init_time, bg_end_time, tg_init_time, tg_end_time, step_size=None, ERROR_STEP=1, SD_NUM=1.5, svg_filepath="cor.svg", show_graph=False, save_svg=False, multi_thread=False, max_workers=None, bootstrap=0, model=None):
+    # the windows are computed once for fitting and scoring
+    if model is None:
+        window_size = step_size or 8
+    else:
+        window_size = model_size(model, "window_size", step_size)
+        model_part(model, "cor")
+    data_window = window_process(data, window_size)
+    if model is None:
+        model = BaselineModel.fit(data, bg_init_time, bg_end_time, window_size=window_size, parts=["cor"], multi_thread=multi_thread, max_workers=max_workers, window=data_window)
+    tg = data_window.time_slice(tg_init_time, tg_end_time)
 
-    bg_distance = np.log2(bg.get_col(DISTANCE_MEAN))
-    bg_temperature = bg.get_col(MAX_TEMPERATURE_MEAN)
+    bg_distance = model.cor["distance"]
+    bg_temperature = model.cor["temperature"]
 
     tg_distance = np.log2(tg.get_col(DISTANCE_MEAN))
     tg_temperature = tg.get_col(MAX_TEMPERATURE_MEAN)
 
-    slope, sec, upper, lower = passing_bablock(bg_distance, bg_temperature)
+    slope = model.cor["slope"]
+    sec = model.cor["n"]
     print("slope: ", slope)
     print("sec: ", sec)
 
-    side = (bg_temperature  - (bg_distance * slope + sec))/((1+slope**2)**0.5)
-    d2 = side.std()*SD_NUM
-    n_plus = sec + d2*(1+slope**2)**0.5
-    n_minus = sec - d2*(1+slope**2)**0.5
-
-    error_data = Data()
-    error_value = 0
-    ex_time = 0
-    for index, data in tg.inner_data.iterrows():
-        time = data[TIME]
-        x = np.log2(data[DISTANCE_MEAN])
-        y = data[MAX_TEMPERATURE_MEAN]
-        if y > x*slope + n_plus:
-            error_value += abs(y - x*slope - n_plus) / ((1+slope**2)**0.5)
-            ex_time = 0
-        elif y < x*slope + n_minus:
-            error_value += abs(y - (x*slope + n_minus)) / ((1+slope**2)**0.5)
-            ex_time = 0
-        elif ex_time > ERROR_STEP:
-            error_value = 0
-            ex_time = 0
-        else:
-            ex_time += 1
-        error_data.append(Data([time, error_value], labels=[TIME, COR_ERROR_VALUE]))
-    error_data.sort(TIME)
-    error_data.reset_index()
+    n_plus, n_minus = model.band(SD_NUM)
+
+    # percentile bands of the fit over resampled background windows
+    bands = None
+    if bootstrap:
+        bands = cor_bootstrap(bg_distance, bg_temperature, n_boot=bootstrap, SD_NUM=SD_NUM, max_workers=max_workers)
+        for name in ["slope", "n", "n_plus", "n_minus"]:
+            print("%s band: " % name, bands[name])
+
+    error_data = cor_scores(model, tg, ERROR_STEP, SD_NUM)
     print(error_data)
 
     if show_graph or save_svg:
@@ -579,6 +1100,10 @@ def cor_process(data, bg_init_time, bg_end_time, tg_init_time, tg_end_time, step
         bg_y = x * slope + n_minus
         ax1.plot(x, bg_y, color="y", linestyle="dashed")
 
+        if bands is not None:
+            ax1.plot(x, x * slope + bands["n_plus"][1], color="y", linestyle="dotted")
+            ax1.plot(x, x * slope + bands["n_minus"][0], color="y", linestyle="dotted")
+
         ax2 = fig.add_subplot(122)
         time = error_data.get_col(TIME)
         error = error_data.get_col(COR_ERROR_VALUE)
@@ -590,27 +1115,91 @@ def cor_process(data, bg_init_time, bg_end_time, tg_init_time, tg_end_time, step
         if show_graph:
             plt.show()
 
-    return (error_data, {"slope": slope, "n": sec, "n_plus": n_plus, "n_minus": n_minus})
+    return (error_data, {"slope": slope, "n": sec, "n_plus": n_plus, "n_minus": n_minus, "bootstrap": bands})
 
-def window_process(data, step_size):
-    data_window = Data(pd.DataFrame())
-    for d in data.split(step_size):
-        d_time_mean = d.get_col(TIME).mean()
-        d_time_mean_data = Data(d_time_mean, labels=[TIME])
-        d_data = d[[MAX_TEMPERATURE, MAX_POS_X, MAX_POS_Y, MIN_TEMPERATURE, MIN_POS_X, MIN_POS_Y, DISTANCE]]
-        d_data_mean = d_data.mean()
-        d_data_std = d_data.std()
-        data_ = d_time_mean_data.join(d_data_mean).join(d_data_std)
-        data_window.append(data_)
-    data_window.reset_index()
-    return data_window
-
-def all_graph(data, bg_init_time, bg_end_time, tg_init_time, tg_end_time, save_svg=True, show_graph=True):
+def cor_scores(model, tg_window, ERROR_STEP=1, SD_NUM=SD_NUM):
+    excess = model.cor_excess(np.log2(tg_window.get_col(DISTANCE_MEAN)), tg_window.get_col(MAX_TEMPERATURE_MEAN), SD_NUM)
+    error_value = cor_error_value(excess, ERROR_STEP)
+    error_data = Data(pd.DataFrame({TIME: tg_window.get_col(TIME).to_numpy(), COR_ERROR_VALUE: error_value}))
+    error_data.sort(TIME)
+    error_data.reset_index()
+    return error_data
+
+def window_process(data, step_size, columns=WINDOW_COLUMNS):
+    # mean time, column means and column stds of every step_size rows in one
+    # reduceat pass. the last window may be shorter
+    df = data.inner_data
+    n = len(df)
+    starts = np.arange(0, n, step_size)
+    counts = np.minimum(step_size, n - starts)
+    if n == 0:
+        labels = [TIME] + [c+MEAN_SUFFIX for c in columns] + [c+STD_SUFFIX for c in columns]
+        return Data(pd.DataFrame(columns=labels))
+
+    times = df[TIME].to_numpy().astype("datetime64[ns]").view(np.int64)
+    offsets = np.add.reduceat(times - times[0], starts)
+    time_mean = (times[0] + offsets // counts).astype("datetime64[ns]")
+
+    values = df[columns].to_numpy(dtype=np.float64)
+    mean = np.add.reduceat(values, starts, axis=0) / counts[:, None]
+    deviation = values - np.repeat(mean, counts, axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        std = np.sqrt(np.add.reduceat(deviation**2, starts, axis=0) / (counts[:, None] - 1))
+    std[counts == 1] = np.nan
+
+    result = {TIME: time_mean}
+    for i, c in enumerate(columns):
+        result[c+MEAN_SUFFIX] = mean[:, i]
+    for i, c in enumerate(columns):
+        result[c+STD_SUFFIX] = std[:, i]
+    return Data(pd.DataFrame(result, copy=False))
+
+def iter_window_process(chunks, step_size):
+    # rows not filling a window are carried over to the next chunk
+    rest = None
+    for data in chunks:
+        df = data.inner_data
+        if rest is not None:
+            df = pd.concat([rest, df])
+        n = len(df) // step_size * step_size
+        if n:
+            yield window_process(Data(df.iloc[:n]), step_size)
+        rest = df.iloc[n:]
+    if rest is not None and len(rest):
+        yield window_process(Data(rest), step_size)
+
+# columns of the shared rows and windows each all_graph scorer reads
+ALL_GRAPH_ROWS = [TIME, MAX_TEMPERATURE, DISTANCE]
+ALL_GRAPH_WINDOWS = [TIME, DISTANCE_MEAN, MAX_TEMPERATURE_MEAN]
+
+def all_graph(data, bg_init_time, bg_end_time, tg_init_time, tg_end_time, save_svg=True, show_graph=True, multi_thread=False, max_workers=None, model=None):
+    # the bg/tg rows and windows are sliced once and put in shared memory, the
+    # three scorers run side by side in worker processes, each fitting its
+    # part of the model when it is missing, and the figure is drawn here
+    if model is None:
+        model = BaselineModel(bg_init_time, bg_end_time)
+
+    window = window_process(data, model.window_size)
+    frames = {
+        "bg": data.time_slice(bg_init_time, bg_end_time),
+        "tg": data.time_slice(tg_init_time, tg_end_time),
+        "bg_window": window.time_slice(bg_init_time, bg_end_time),
+        "tg_window": window.time_slice(tg_init_time, tg_end_time),
+    }
+    arrays = {}
+    for key, frame in frames.items():
+        for name in ALL_GRAPH_WINDOWS if key.endswith("_window") else ALL_GRAPH_ROWS:
+            arrays[key + "/" + name] = frame.get_col(name).to_numpy()
+
+    workers = min(len(BaselineModel.PARTS), max_workers or os.cpu_count() or 1)
+    with SharedArrays(arrays) as shared:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            tasks = [(part, shared.spec, model, tg_init_time, multi_thread, max_workers) for part in BaselineModel.PARTS]
+            results = dict(zip(BaselineModel.PARTS, executor.map(_all_graph_task, tasks)))
 
     data_time = data.get_col(TIME)
     data_distance = data.get_col(DISTANCE)
     data_max_temperature = data.get_col(MAX_TEMPERATURE)
-    data_min_temperature = data.get_col(MIN_TEMPERATURE)
 
     fig = plt.figure()
     ax1 = fig.add_subplot(111)
@@ -619,39 +1208,150 @@ def all_graph(data, bg_init_time, bg_end_time, tg_init_time, tg_end_time, save_s
     ax1.set_xlim([min(data_time), max(data_time)])
     ax1.plot(data_time, data_distance, color="g")
     ax1_error = ax1.twinx()
-    error_data, _ = distance_process(data,
-                                     bg_init_time, bg_end_time,
-                                     tg_init_time, tg_end_time,
-                                     save_svg=False, show_graph=False)
-    time = error_data.get_col(TIME)
-    error_value = error_data.get_col(ERROR_VALUE)
-    ax1_error.plot(time, error_value, color="b")
+    ax1_error.plot(*results["distance"], color="b")
 
     ax2 = ax1.twinx()
     ax2.plot(data_time, data_max_temperature, color="y")
     ax2_error = ax2.twinx()
-    error_data, _ = temperature_process(data,
-                                        bg_init_time, bg_end_time,
-                                        tg_init_time, tg_end_time,
-                                        save_svg=False, show_graph=False)
-    time = error_data.get_col(TIME)
-    error_value = error_data.get_col(TEMPERATURE_ERROR_DATA)
-    ax2_error.plot(time, error_value, color="m")
+    ax2_error.plot(*results["temperature"], color="m")
 
     ax3 = ax1.twinx()
-    error_data, _ = cor_process(data,
-                               bg_init_time, bg_end_time,
-                               tg_init_time, tg_end_time,
-                               save_svg=False, show_graph=False)
-    time = error_data.get_col(TIME)
-    time = error_data.get_col(TIME)
-    error_value = error_data.get_col(COR_ERROR_VALUE)
-    ax3.plot(time, error_value, color="r")
+    ax3.plot(*results["cor"], color="r")
 
     if save_svg:
         plt.savefig("allgraph.svg", format="svg")
     if show_graph:
         plt.show()
+    return results
+
+def _all_graph_task(args):
+    part, spec, model, tg_init_time, multi_thread, max_workers = args
+    with attach(spec) as arrays:
+        return _all_graph_score(part, arrays, model, tg_init_time, multi_thread, max_workers)
+
+def _all_graph_score(part, arrays, model, tg_init_time, multi_thread, max_workers):
+    # (time, error value) of one part. the frames are views of the shared
+    # arrays, so the returned arrays are copies
+    frames = {}
+    for key, array in arrays.items():
+        frame, name = key.split("/")
+        frames.setdefault(frame, {})[name] = array
+    frames = {key: Data(pd.DataFrame(columns, copy=False)) for key, columns in frames.items()}
+
+    if part == "temperature":
+        if not model.has(part):
+            model.fit_profile(frames["bg"], [MAX_TEMPERATURE])
+        error_data, _ = temperature_scores(model, [frames["bg"], frames["tg"]], columns=[MAX_TEMPERATURE])[MAX_TEMPERATURE]
+        column = TEMPERATURE_ERROR_DATA
+    elif part == "distance":
+        if not model.has(part):
+            model.fit_profile(frames["bg"], [DISTANCE])
+        error_data, _ = distance_scores(model, frames["tg"], tg_init_time)
+        column = ERROR_VALUE
+    else:
+        if not model.has(part):
+            model.fit_cor(frames["bg_window"], multi_thread=multi_thread, max_workers=max_workers)
+        error_data = cor_scores(model, frames["tg_window"])
+        column = COR_ERROR_VALUE
+    return (error_data.get_col(TIME).to_numpy(copy=True), error_data.get_col(column).to_numpy(copy=True))
+
+# columns a calc run of the GUI reads from the shared copy of the data
+CALC_COLUMNS = [TIME, MAX_TEMPERATURE, MIN_TEMPERATURE, DISTANCE]
+
+def calc_fit(spec, part, bg_init_time, bg_end_time, step_size=8, window_size=8):
+    # first stage of a calc run: the model part fitted from the shared data
+    with attach(spec) as arrays:
+        return _calc_fit(arrays, part, bg_init_time, bg_end_time, step_size, window_size)
+
+def _calc_fit(arrays, part, bg_init_time, bg_end_time, step_size, window_size):
+    data = Data(pd.DataFrame(arrays, copy=False))
+    if part == "cor":
+        model = BaselineModel(bg_init_time, bg_end_time, step_size, window_size)
+        model.fit_cor(window_process(data, window_size, [MAX_TEMPERATURE, DISTANCE]).time_slice(bg_init_time, bg_end_time))
+        return model
+    return BaselineModel.fit(data, bg_init_time, bg_end_time, step_size=step_size, window_size=window_size, parts=[part])
+
+def calc_score(spec, part, model, option):
+    # second stage: (time, error value) of the target range, plus the band of
+    # the fit for cor. option holds the calc options of the GUI page
+    with attach(spec) as arrays:
+        return _calc_score(arrays, part, model, option)
+
+def _calc_score(arrays, part, model, option):
+    data = Data(pd.DataFrame(arrays, copy=False))
+    bg_init_time, bg_end_time = option["bg_time_init"], option["bg_time_end"]
+    tg_init_time, tg_end_time = option["tg_time_init"], option["tg_time_end"]
+    info = None
+    if part == "temperature":
+        column = option.get("column", MAX_TEMPERATURE)
+        bg = data.time_slice(bg_init_time, bg_end_time)
+        tg = data.time_slice(tg_init_time, tg_end_time)
+        error_data, _ = temperature_scores(model, [bg, tg], option["thres_sd_heat"], [column])[column]
+        value = TEMPERATURE_ERROR_DATA
+    elif part == "distance":
+        error_data, _ = distance_scores(model, data.time_slice(tg_init_time, tg_end_time), tg_init_time, option["welch_thres"])
+        value = ERROR_VALUE
+    else:
+        tg_window = window_process(data, model.window_size, [MAX_TEMPERATURE, DISTANCE]).time_slice(tg_init_time, tg_end_time)
+        error_data = cor_scores(model, tg_window, option["error_step"], option["sd_num"])
+        value = COR_ERROR_VALUE
+        n_plus, n_minus = model.band(option["sd_num"])
+        info = {"slope": model.cor["slope"], "n": model.cor["n"], "n_plus": n_plus, "n_minus": n_minus}
+    return (error_data.get_col(TIME).to_numpy(copy=True), error_data.get_col(value).to_numpy(copy=True), info)
+
+def parameter_sweep(data, bg_init_time, bg_end_time, tg_init_time, tg_end_time, step_size=(8,), thres_sd_heat=(1.5,), welch_thres=(0.5,), sd_num=(SD_NUM,), error_step=(1,), targets=None, multi_thread=False, max_workers=None):
+    # error series for every point of the parameter grid as one long table:
+    # target, the parameters used by that target, time and error value. every
+    # row equals the series of the single process run with those parameters;
+    # the temperature targets are the max and min temperature columns and
+    # cover bg and tg like temperature_process. the baseline, z scores, p
+    # values and windows are computed once per step_size and every threshold
+    # axis is one batch scan. targets defaults to every part
+    targets = tuple(BaselineModel.PARTS) if targets is None else tuple(targets)
+    frames = []
+    bg = data.time_slice(bg_init_time, bg_end_time)
+    tg = data.time_slice(tg_init_time, tg_end_time)
+    for size in step_size:
+        window = window_process(data, size) if "cor" in targets else None
+        model = BaselineModel.fit(data, bg_init_time, bg_end_time, step_size=size, window_size=size, parts=targets, multi_thread=multi_thread, max_workers=max_workers, window=window)
+
+        columns = [c for c in TEMPERATURE_COLUMNS if model.has_profile([c])]
+        if columns:
+            time, error = temperature_z_scores(model, [bg, tg], columns)
+            thres = np.asarray(thres_sd_heat, dtype=np.float64)
+            values = temperature_error_value(error[:, None, :], thres[None, :, None])
+            for i, column in enumerate(columns):
+                frames.append(_sweep_frame(column, time, values[i], {"step_size": size, "thres_sd_heat": thres}))
+
+        if model.has("distance"):
+            welch_data = model.welch(tg, tg_init_time)
+            p_value = welch_data.get_col(WELCH_P_VALUE).to_numpy(dtype=np.float64)
+            thres = np.asarray(welch_thres, dtype=np.float64)
+            values = distance_error_value(p_value[None, :], thres[:, None])
+            frames.append(_sweep_frame("distance", welch_data.get_col(TIME).to_numpy(), values, {"step_size": size, "welch_thres": thres}))
+
+        if model.has("cor"):
+            tg_window = window.time_slice(tg_init_time, tg_end_time)
+            tg_distance = np.log2(tg_window.get_col(DISTANCE_MEAN).to_numpy(dtype=np.float64))
+            tg_temperature = tg_window.get_col(MAX_TEMPERATURE_MEAN).to_numpy(dtype=np.float64)
+            sd, step = (a.ravel() for a in np.meshgrid(np.asarray(sd_num, dtype=np.float64), np.asarray(error_step, dtype=np.float64), indexing="ij"))
+            excess = model.cor_excess(tg_distance[None, :], tg_temperature[None, :], sd[:, None])
+            values = cor_error_value(excess, step)
+            frames.append(_sweep_frame("cor", tg_window.get_col(TIME).to_numpy(), values, {"step_size": size, "sd_num": sd, "error_step": step}))
+
+    if not frames:
+        return Data(pd.DataFrame(columns=[TARGET] + SWEEP_PARAMETERS + [TIME, ERROR_VALUE]))
+    return Data(pd.concat(frames, ignore_index=True))
+
+def _sweep_frame(target, time, values, parameters):
+    rows, n = values.shape
+    frame = {TARGET: np.full(rows*n, target)}
+    for name in SWEEP_PARAMETERS:
+        value = np.broadcast_to(np.asarray(parameters.get(name, np.nan), dtype=np.float64), (rows,))
+        frame[name] = np.repeat(value, n)
+    frame[TIME] = np.tile(time, rows)
+    frame[ERROR_VALUE] = values.ravel()
+    return pd.DataFrame(frame)
 
 def fig_to_svgtree(fig):
     f = BytesIO()
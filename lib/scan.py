@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+#encoding: utf-8
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# leaky accumulator behind the temperature, distance and cor error scores.
+# on a hit step the value grows by increment[t]. on a quiet step it shrinks by
+# decrement and is clamped at floor, unless more than reset_after quiet steps
+# came in a row, which resets it to 0 and restarts the quiet count.
+#
+# without resets e[t] = max(e[t-1] + d[t], c[t]) with c = -inf on hits, so
+# e[t] = S[t] + max(e0, max_{k<=t} c[k] - S[k]) where S is the cumsum of d.
+# the numpy version evaluates that per block of SCAN_BLOCK steps, carrying e
+# between blocks so that S stays small.
+
+SCAN_BLOCK = 2**14
+
+
+def _reset_points(hit, reset_after):
+    # quiet step q (1 based, counted since the last hit) resets when the
+    # counter, restarted by every reset, passes reset_after
+    period = np.maximum(np.floor(reset_after).astype(np.int64) + 2, 1)[:, None]
+    index = np.arange(hit.shape[1])
+    quiet = index - np.maximum.accumulate(np.where(hit, index, -1), axis=1)
+    return ~hit & (quiet % period == 0)
+
+
+def _segment_max(values, segment):
+    # running maximum of every row restarted at every new segment id
+    unique, inverse = np.unique(values, return_inverse=True)
+    key = np.maximum.accumulate(segment.astype(np.int64)*unique.size + inverse.reshape(values.shape), axis=1)
+    return unique[key % unique.size]
+
+
+def _scan_block(hit, increment, decrement, floor, reset, initial):
+    d = np.where(hit, increment, -decrement)
+    # an infinite increment stays until the next reset
+    finite = np.isfinite(d)
+    all_finite = finite.all()
+    if not all_finite:
+        d[~finite] = 0.0
+    any_reset = reset.any()
+    if any_reset:
+        d[reset] = 0.0
+    total = np.cumsum(d, axis=1)
+
+    index = np.arange(hit.shape[1])
+    if not any_reset:
+        start = np.where(hit, -np.inf, floor) - total
+        value = total + np.maximum(np.maximum.accumulate(start, axis=1), initial[:, None])
+        last_reset = -1
+    elif floor == -np.inf:
+        # only the reset points can start the maximum
+        last_reset = np.maximum.accumulate(np.where(reset, index, -1), axis=1)
+        base = np.take_along_axis(total, np.maximum(last_reset, 0), axis=1)
+        value = total + np.where(last_reset >= 0, -base, initial[:, None])
+    else:
+        start = np.where(hit, -np.inf, floor) - total
+        start[reset] = -total[reset]
+        segment = np.cumsum(reset, axis=1)
+        best = _segment_max(np.concatenate([initial[:, None], start], axis=1), np.concatenate([np.zeros((hit.shape[0], 1), dtype=segment.dtype), segment], axis=1))
+        value = total + best[:, 1:]
+        last_reset = np.maximum.accumulate(np.where(reset, index, -1), axis=1)
+    if not all_finite:
+        last_infinite = np.maximum.accumulate(np.where(finite, -1, index), axis=1)
+        value[last_infinite > last_reset] = np.inf
+    return value
+
+
+def _scan_numpy(hit, increment, decrement, floor, reset, initial):
+    rows, n = hit.shape
+    value = np.empty((rows, n))
+    width = max(SCAN_BLOCK // rows, 1)
+    for start in range(0, n, width):
+        end = min(start + width, n)
+        value[:, start:end] = _scan_block(hit[:, start:end], increment[:, start:end], decrement[:, start:end], floor, reset[:, start:end], initial)
+        initial = value[:, end-1]
+    return value
+
+
+def _scan_loop(hit, increment, decrement, floor, reset, initial):
+    value = np.empty(hit.shape)
+    for r in range(hit.shape[0]):
+        e = initial[r]
+        for t in range(hit.shape[1]):
+            if hit[r, t]:
+                e += increment[r, t]
+            elif reset[r, t]:
+                e = 0.0
+            else:
+                e = max(e - decrement[r, t], floor)
+            value[r, t] = e
+    return value
+
+
+_scan_jit = numba.njit(cache=True)(_scan_loop) if numba is not None else None
+
+
+def error_scan(hit, increment, decrement=0.0, floor=None, reset_after=None, initial=0.0, method=None):
+    # one series, or a batch of series as the rows of 2d arrays, with
+    # reset_after and initial given per row. method is "numpy" or "jit", by
+    # default jit when numba is installed
+    hit = np.asarray(hit, dtype=bool)
+    increment = np.asarray(increment, dtype=np.float64)
+    decrement = np.asarray(decrement, dtype=np.float64)
+    shape = np.broadcast(hit, increment, decrement).shape
+    batch = (int(np.prod(shape[:-1])), shape[-1])
+    hit = np.broadcast_to(hit, shape).reshape(batch)
+    increment = np.broadcast_to(increment, shape).reshape(batch)
+    decrement = np.broadcast_to(decrement, shape).reshape(batch)
+    floor = -np.inf if floor is None else float(floor)
+    initial = np.broadcast_to(np.asarray(initial, dtype=np.float64).reshape(-1), batch[:1]).copy()
+    if reset_after is None:
+        reset = np.zeros(batch, dtype=bool)
+    else:
+        reset = _reset_points(hit, np.broadcast_to(np.asarray(reset_after, dtype=np.float64).reshape(-1), batch[:1]))
+
+    if method is None:
+        method = "jit" if _scan_jit is not None else "numpy"
+    if method == "jit":
+        if _scan_jit is None:
+            raise ImportError("numba is required for method='jit'")
+        value = _scan_jit(np.ascontiguousarray(hit), np.ascontiguousarray(increment), np.ascontiguousarray(decrement), floor, reset, initial)
+    else:
+        value = _scan_numpy(hit, increment, decrement, floor, reset, initial)
+    return value.reshape(shape)
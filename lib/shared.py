@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+#encoding: utf-8
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# numpy arrays handed to worker processes through shared memory blocks. the
+# parent copies every array in once, a task only carries the spec of
+# (block name, shape, dtype) per array and the worker maps the blocks without
+# copying. only fixed size dtypes (numbers, bool, datetime64) can be shared.
+
+
+class SharedArrays(object):
+    def __init__(self, arrays):
+        self.blocks = []
+        self.spec = {}
+        try:
+            for name, array in arrays.items():
+                array = np.ascontiguousarray(array)
+                if array.dtype.hasobject:
+                    raise TypeError("cannot share object array %s" % name)
+                block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                self.blocks.append(block)
+                np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+                self.spec[name] = (block.name, array.shape, array.dtype.str)
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@contextmanager
+def attach(spec):
+    # views of the shared arrays, valid inside the with block only. results
+    # leaving the block must not be views of them
+    blocks = []
+    arrays = {}
+    try:
+        for name, (block_name, shape, dtype) in spec.items():
+            block = shared_memory.SharedMemory(name=block_name)
+            blocks.append(block)
+            arrays[name] = np.ndarray(shape, dtype, buffer=block.buf)
+        yield arrays
+    finally:
+        arrays.clear()
+        for block in blocks:
+            try:
+                block.close()
+            except BufferError:
+                # a view is still referenced, e.g. by a traceback. the mapping
+                # goes away with the process
+                pass
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+#encoding: utf-8
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# order statistics of the pairwise slopes (y[j]-y[i])/(x[j]-x[i]), x[i] != x[j],
+# without materializing all n*(n-1)/2 of them.
+#
+# for a slope bound t, sort the points by u = y - t*x. the slope of a pair is
+# between lo and hi exactly when the pair is ordered differently by u_lo and
+# u_hi, so counting slopes in (lo, hi) is counting inversions of u_hi ranks
+# taken in u_lo order. pairs with equal x are never inverted.
+#
+# u is rounded, so pairs whose u values are within a few ulps of each other
+# can come out in either order. those pairs are listed and counted again by
+# their float slope (y[j]-y[i])/(x[j]-x[i]), the value the exact path sorts.
+
+# rounding error of u, in ulps of max(|y| + |t*x|)
+NEAR_ULPS = 8
+SELECT_CAP = 4
+SAMPLE_SIZE = 8
+MIN_SAMPLES = 32
+MAX_SAMPLE_ROUNDS = 8
+
+
+def _key(x, y, t):
+    if t == -np.inf:
+        return (x, y)
+    if t == np.inf:
+        return (-x, y)
+    return (y - t*x,)
+
+
+def _dense_rank(keys):
+    order = np.lexsort(keys[::-1])
+    change = np.zeros(order.size, dtype=bool)
+    for key in keys:
+        sorted_key = key[order]
+        change[1:] |= sorted_key[1:] != sorted_key[:-1]
+    rank = np.empty(order.size, dtype=np.int64)
+    rank[order] = np.cumsum(change)
+    return rank
+
+
+def _inversions(values, list_pairs=False, strict=True):
+    # pairs i < j with values[i] > values[j] (>= unless strict), by bottom-up
+    # merge levels. at each level the left half of every block is sorted once
+    # and the right half is located in it with searchsorted
+    n = values.size
+    count = 0
+    lefts = []
+    rights = []
+    if n < 2:
+        return count, (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+
+    m = int(values.max()) + 1
+    index = np.arange(n)
+    width = 1
+    while width < n:
+        block = index // (2*width)
+        is_left = index % (2*width) < width
+        left = index[is_left]
+        right = index[~is_left]
+
+        left_key = block[left]*m + values[left]
+        order = np.argsort(left_key, kind="stable")
+        left_key = left_key[order]
+        right_block = block[right]
+        start = np.searchsorted(left_key, right_block*m + values[right], side="right" if strict else "left")
+        end = np.searchsorted(left_key, (right_block+1)*m, side="left")
+        c = end - start
+        count += int(c.sum())
+
+        if list_pairs and c.any():
+            owner = np.repeat(np.arange(right.size), c)
+            position = start[owner] + np.arange(owner.size) - np.repeat(np.cumsum(c) - c, c)
+            lefts.append(left[order][position])
+            rights.append(right[owner])
+        width *= 2
+
+    if not list_pairs:
+        return count, None
+    if not lefts:
+        return count, (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    return count, (np.concatenate(lefts), np.concatenate(rights))
+
+
+def _distinct_points(x, y):
+    # distinct (x, y) points, the point of every sample and the multiplicity
+    # of every point. pairs of equal points have no slope
+    rank = _dense_rank((x, y))
+    weight = np.bincount(rank)
+    first = np.empty(weight.size, dtype=np.int64)
+    first[rank] = np.arange(x.size)
+    return x[first], y[first], rank, weight
+
+
+def _near_pairs(x, y, bounds):
+    # keys a*m + b, a < b, of the pairs of distinct points whose u order at a
+    # finite bound may be off because of rounding
+    m = x.size
+    keys = []
+    for t in bounds:
+        if not np.isfinite(t) or m < 2:
+            continue
+        u = y - t*x
+        tol = 2*NEAR_ULPS*np.finfo(np.float64).eps*np.max(np.abs(y) + np.abs(t*x)) + np.finfo(np.float64).tiny
+        order = np.argsort(u, kind="stable")
+        u = u[order]
+        count = np.searchsorted(u, u + tol, side="right") - np.arange(m) - 1
+        owner = np.repeat(np.arange(m), count)
+        other = owner + 1 + np.arange(owner.size) - np.repeat(np.cumsum(count) - count, count)
+        a = order[owner]
+        b = order[other]
+        keys.append(np.minimum(a, b)*m + np.maximum(a, b))
+    if not keys:
+        return np.empty(0, dtype=np.int64)
+    return np.unique(np.concatenate(keys))
+
+
+def _pair_slopes(x, y, i, j):
+    # float slopes of the pairs and whether they are defined (x[i] != x[j])
+    dx = x[j] - x[i]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (y[j] - y[i]) / dx, dx != 0
+
+
+def count_slopes(x, y, lo=-np.inf, hi=np.inf):
+    # number of slopes s with lo < s < hi
+    lo_rank = _dense_rank(_key(x, y, lo))
+    hi_rank = _dense_rank(_key(x, y, hi))
+    order = np.lexsort((hi_rank, lo_rank))
+    count, _ = _inversions(hi_rank[order])
+
+    if np.isfinite(lo) or np.isfinite(hi):
+        px, py, inverse, weight = _distinct_points(x, y)
+        near = _near_pairs(px, py, (lo, hi))
+        if near.size:
+            a, b = np.divmod(near, px.size)
+            # equal points share their ranks, so any sample of a point will do
+            sample = np.empty(px.size, dtype=np.int64)
+            sample[inverse] = np.arange(x.size)
+            counted = (lo_rank[sample[a]] - lo_rank[sample[b]])*(hi_rank[sample[a]] - hi_rank[sample[b]]) < 0
+            slopes, valid = _pair_slopes(px, py, a, b)
+            exact = valid & (lo < slopes) & (slopes < hi)
+            count += int((weight[a]*weight[b])[exact].sum()) - int((weight[a]*weight[b])[counted].sum())
+    return count
+
+
+def slopes_between(x, y, lo=-np.inf, hi=np.inf):
+    # slopes s with lo < s <= hi. pairs on s == hi are tied in hi order, so
+    # ties count as inversions here and pairs tied in lo order are dropped
+    lo_rank = _dense_rank(_key(x, y, lo))
+    hi_rank = _dense_rank(_key(x, y, hi))
+    order = np.lexsort((-hi_rank, lo_rank))
+    _, (a, b) = _inversions(hi_rank[order], list_pairs=True, strict=False)
+    i = order[a]
+    j = order[b]
+    keep = lo_rank[i] != lo_rank[j]
+    i = i[keep]
+    j = j[keep]
+    slopes = (y[j] - y[i]) / (x[j] - x[i])
+
+    if np.isfinite(lo) or np.isfinite(hi):
+        px, py, inverse, weight = _distinct_points(x, y)
+        near = _near_pairs(px, py, (lo, hi))
+        if near.size:
+            pi = inverse[i]
+            pj = inverse[j]
+            slopes = slopes[~np.isin(np.minimum(pi, pj)*px.size + np.maximum(pi, pj), near)]
+            a, b = np.divmod(near, px.size)
+            near_slopes, valid = _pair_slopes(px, py, a, b)
+            exact = valid & (lo < near_slopes) & (near_slopes <= hi)
+            slopes = np.concatenate([slopes, np.repeat(near_slopes[exact], (weight[a]*weight[b])[exact])])
+    return slopes
+
+
+def _sample_slopes(x, y, size, rng):
+    i = rng.integers(0, x.size, size)
+    j = rng.integers(0, x.size, size)
+    valid = x[i] != x[j]
+    i = i[valid]
+    j = j[valid]
+    return (y[j] - y[i]) / (x[j] - x[i])
+
+
+def _bisect(lo, hi):
+    if np.isfinite(lo) and np.isfinite(hi):
+        pivot = lo/2 + hi/2
+    elif np.isfinite(lo):
+        pivot = lo + abs(lo) + 1
+    elif np.isfinite(hi):
+        pivot = hi - abs(hi) - 1
+    else:
+        pivot = 0.0
+    if lo < pivot < hi:
+        return pivot
+    return None
+
+
+def select_slope(x, y, rank, total=None, rng=None, samples=None):
+    # rank-th smallest slope (0 based). the search keeps a lo < slope <= hi
+    # bracket with exact counts and narrows it with pivots drawn from a random
+    # sample of slopes, until few enough slopes are left to list them
+    rng = rng if rng is not None else np.random.default_rng()
+    n = x.size
+    if total is None:
+        total = count_slopes(x, y)
+    if not 0 <= rank < total:
+        raise IndexError("slope rank out of range")
+
+    cap = SELECT_CAP*n + 1024
+    size = SAMPLE_SIZE*n + 1024
+    if samples is None:
+        samples = _sample_slopes(x, y, size, rng)
+
+    # below_* is the number of slopes <= the bound
+    lo, hi = -np.inf, np.inf
+    below_lo, below_hi = 0, total
+    stalled = False
+    while below_hi - below_lo > cap:
+        pivots = []
+        if not stalled:
+            inside = samples[(samples > lo) & (samples < hi)]
+            rounds = 0
+            while inside.size < MIN_SAMPLES and rounds < MAX_SAMPLE_ROUNDS:
+                fresh = _sample_slopes(x, y, size, rng)
+                inside = np.concatenate([inside, fresh[(fresh > lo) & (fresh < hi)]])
+                rounds += 1
+            samples = inside
+            if inside.size >= 2:
+                inside = np.sort(inside)
+                p = (rank - below_lo) / (below_hi - below_lo)
+                delta = 3*np.sqrt(p*(1-p)/inside.size) + 1/inside.size
+                pivots = [inside[max(int((p-delta)*inside.size), 0)], inside[min(int((p+delta)*inside.size), inside.size-1)]]
+        elif np.isfinite(hi) and count_slopes(x, y, -np.inf, hi) <= rank:
+            # every slope left in the bracket equals hi
+            return hi
+        if not pivots:
+            pivot = _bisect(lo, hi)
+            if pivot is None:
+                break
+            pivots = [pivot]
+
+        bracket = (lo, hi)
+        for pivot in pivots:
+            if not lo < pivot < hi:
+                continue
+            below = total - count_slopes(x, y, pivot, np.inf)
+            if below <= rank:
+                lo, below_lo = pivot, below
+            else:
+                hi, below_hi = pivot, below
+        stalled = (lo, hi) == bracket
+
+    candidates = np.sort(slopes_between(x, y, lo, hi))
+    position = min(max(rank - below_lo, 0), candidates.size - 1)
+    return candidates[position]
+
+
+
+# the pair space (i, j), i < j, is cut into TILE_SIZE x TILE_SIZE tiles whose
+# slopes are computed and sorted with numpy in worker processes. a first pass
+# counts the slopes of every tile into bins between sampled slope quantiles, a
+# second pass sends back only the sorted runs of the bins holding the ranks
+TILE_SIZE = 2048
+EDGE_COUNT = 4096
+EDGE_SAMPLES = 64
+
+_tile_x = None
+_tile_y = None
+
+
+def _tile_init(x, y):
+    global _tile_x, _tile_y
+    _tile_x = x
+    _tile_y = y
+
+
+def _tile_slopes(tile):
+    i0, i1, j0, j1 = tile
+    dx = _tile_x[j0:j1][None, :] - _tile_x[i0:i1][:, None]
+    dy = _tile_y[j0:j1][None, :] - _tile_y[i0:i1][:, None]
+    valid = dx != 0
+    if i0 == j0:
+        valid &= np.arange(i0, i1)[:, None] < np.arange(j0, j1)[None, :]
+    slopes = dy[valid] / dx[valid]
+    slopes.sort()
+    return slopes
+
+
+def _tile_histogram(args):
+    # bin b holds the slopes in [edges[b-1], edges[b])
+    tile, edges = args
+    slopes = _tile_slopes(tile)
+    position = np.searchsorted(slopes, edges, side="left")
+    return np.diff(position, prepend=0, append=slopes.size)
+
+
+def _tile_collect(args):
+    tile, edges, wanted = args
+    slopes = _tile_slopes(tile)
+    bounds = np.concatenate([[-np.inf], edges, [np.inf]])
+    runs = []
+    for b in wanted:
+        start = np.searchsorted(slopes, bounds[b], side="left")
+        end = np.searchsorted(slopes, bounds[b+1], side="left") if b < edges.size else slopes.size
+        runs.append(slopes[start:end])
+    return runs
+
+
+def _tiles(n, tile_size):
+    starts = range(0, n, tile_size)
+    return [(i, min(i + tile_size, n), j, min(j + tile_size, n)) for i in starts for j in starts if j >= i]
+
+
+def parallel_select_slopes(x, y, ranks, bound=-1.0, max_workers=None, tile_size=None, rng=None):
+    # ranks(below, total) gives the slope ranks (0 based) to select, where
+    # below is the number of slopes smaller than bound. returns the slopes
+    rng = rng if rng is not None else np.random.default_rng()
+    tiles = _tiles(x.size, tile_size or TILE_SIZE)
+    samples = _sample_slopes(x, y, EDGE_COUNT * EDGE_SAMPLES, rng)
+    edges = np.quantile(samples, np.linspace(0, 1, EDGE_COUNT)) if samples.size else np.empty(0)
+    edges = np.unique(np.append(edges, bound))
+    bound_bin = int(np.searchsorted(edges, bound, side="right"))
+
+    workers = max_workers or os.cpu_count() or 1
+    chunksize = max(len(tiles) // (4 * workers), 1)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_tile_init, initargs=(x, y)) as executor:
+        counts = np.zeros(edges.size + 1, dtype=np.int64)
+        for c in executor.map(_tile_histogram, [(tile, edges) for tile in tiles], chunksize=chunksize):
+            counts += c
+
+        wanted_ranks = list(ranks(int(counts[:bound_bin].sum()), int(counts.sum())))
+        wanted_bins = np.searchsorted(np.cumsum(counts), wanted_ranks, side="right")
+        wanted = np.unique(wanted_bins)
+
+        runs = [[] for _ in wanted]
+        for tile_runs in executor.map(_tile_collect, [(tile, edges, wanted) for tile in tiles], chunksize=chunksize):
+            for merged, run in zip(runs, tile_runs):
+                merged.append(run)
+
+    before = np.cumsum(counts) - counts
+    runs = {b: np.sort(np.concatenate(merged)) for b, merged in zip(wanted, runs)}
+    return [runs[b][rank - before[b]] for b, rank in zip(wanted_bins, wanted_ranks)]
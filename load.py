@@ -29,18 +29,32 @@ TG_INIT_TIME = datetime.datetime(year=2019, month=7, day=4)
 TG_END_TIME = datetime.datetime(year=2019, month=7, day=10)
 
 
+def parse_list(value, value_type):
+    # "8,16,32" -> [8, 16, 32]. a single value gives a one element list
+    return [value_type(v) for v in str(value).split(",")]
+
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument('load_file', help="load data csv file")
+    parser.add_argument('load_file', help="load data csv file, or a directory of csv files")
     parser.add_argument("bg_time_range", help="target time range. format: %Y/%m/%d-%Y/%m/%d")
     parser.add_argument("tg_time_range", help="target time range. format: %Y/%m/%d-%Y/%m/%d")
     parser.add_argument("--use-cache", help="save inner process data", action="store_true")
+    parser.add_argument("--clear-cache", help="remove cached data of load_file before loading", action="store_true")
     parser.add_argument("--target", help="process target (distance, max_heat_temperature etc...)", default="all")
     parser.add_argument("--header-format", help="csv file header format. if csv has header, set use_header", default="a3")
-    parser.add_argument("--step-size", help="window size datasplit", default=8)
-    parser.add_argument("--error-step-size", help="error step size using cor process", default=1)
-    parser.add_argument("--thres-sd-heat", help="value using temperature process", default=1.5)
+    parser.add_argument("--step-size", help="window size datasplit. comma separated list using --target sweep. default 8, or the size of --load-model", default=None)
+    parser.add_argument("--error-step-size", help="error step size using cor process. comma separated list using --target sweep", default="1")
+    parser.add_argument("--thres-sd-heat", help="value using temperature process. comma separated list using --target sweep", default="1.5")
+    parser.add_argument("--welch-thres", help="p value threshold using distance process. comma separated list using --target sweep", default="0.5")
+    parser.add_argument("--sd-num", help="band width in sd using cor process. comma separated list using --target sweep", default="1.5")
+    parser.add_argument("--sweep-output", help="result table of --target sweep", default="sweep.csv")
+    parser.add_argument("--multi-thread", help="run the cor regression in a process pool", action="store_true")
+    parser.add_argument("--workers", help="process pool size using --multi-thread. default cpu count", type=int, default=None)
+    parser.add_argument("--bootstrap", help="number of bootstrap resamples for the cor bands. default 0 (off)", type=int, default=0)
+    parser.add_argument("--save-model", help="save the background baseline model to this file", default=None)
+    parser.add_argument("--load-model", help="score with a saved background baseline model instead of fitting bg_time_range", default=None)
     parser.add_argument("--show-graph", help="show graph. default True", action="store_true", default=True)
     parser.add_argument("--save-svg", help="graph save as svg file. default True", action="store_true", default=True)
     args = parser.parse_args()
@@ -50,9 +64,16 @@ if __name__ == "__main__":
     csv_file_path = args.load_file
     tg_time_range = args.tg_time_range
     bg_time_range = args.bg_time_range
-    step_size = args.step_size
-    error_step_size = args.error_step_size
-    thres_sd_heat = args.thres_sd_heat
+    step_sizes = parse_list(args.step_size or "8", int)
+    error_step_sizes = parse_list(args.error_step_size, int)
+    thres_sd_heats = parse_list(args.thres_sd_heat, float)
+    welch_thress = parse_list(args.welch_thres, float)
+    sd_nums = parse_list(args.sd_num, float)
+    step_size = step_sizes[0]
+    error_step_size = error_step_sizes[0]
+    thres_sd_heat = thres_sd_heats[0]
+    welch_thres = welch_thress[0]
+    sd_num = sd_nums[0]
 
     bg_time_init = datetime.datetime.strptime(bg_time_range.split('-')[0], "%Y/%m/%d")
     bg_time_end = datetime.datetime.strptime(bg_time_range.split('-')[1], "%Y/%m/%d")
@@ -64,39 +85,54 @@ if __name__ == "__main__":
     print("TG init: ", tg_time_init)
     print("TG end : ", tg_time_end)
 
-    if args.header_format == "a3":
-        loader = Loader(csv_file_path, names=[TIME, MAX_TEMPERATURE, MAX_POS_X, MAX_POS_Y, MIN_TEMPERATURE, MIN_POS_X, MIN_POS_Y])
-        loader.set_preprocess(a3_preprocess)
-    elif args.header_format == "lepton":
-        loader = Loader(csv_file_path, names=[TIME, MAX_TEMPERATURE, MAX_POS_X, MAX_POS_Y, MIN_TEMPERATURE, MIN_POS_X, MIN_POS_Y])
-        loader.set_preprocess(a3_preprocess)
-    else:
+    if args.header_format not in SCHEMAS:
         #FIXME: error process
         raise
 
+    if args.clear_cache:
+        clear_cache(csv_file_path)
+
     # preprocess
-    data = loader.load()
-    data = calc_distance(data)
+    data = load_data(csv_file_path, args.header_format, use_cache=args.use_cache)
+
+    model = None
+    if args.load_model:
+        model = BaselineModel.load(args.load_model)
+        if args.step_size is None:
+            # the sizes the model was fitted with
+            step_size = None
+    elif args.save_model:
+        model = BaselineModel.fit(data, bg_time_init, bg_time_end, step_size=step_size, window_size=step_size, multi_thread=args.multi_thread, max_workers=args.workers)
+    if args.save_model:
+        model.save(args.save_model)
 
     if args.target == "distance":
         print("[#] Make Distance Graph")
-        distance_process(data, bg_time_init, bg_time_end, tg_time_init, tg_time_end, step_size=step_size, save_svg=save_svg, show_graph=show_graph)
+        distance_process(data, bg_time_init, bg_time_end, tg_time_init, tg_time_end, step_size=step_size, welch_thres=welch_thres, save_svg=save_svg, show_graph=show_graph, model=model)
         print("[!] Process has done")
         exit(0)
     elif args.target == "max_temperature" or args.target == "temperature":
         print("[#] Make Max temperature Grpah")
-        temperature_process(data, bg_time_init, bg_time_end, tg_time_init, tg_time_end, step_size=step_size, save_svg=save_svg, show_graph=show_graph)
+        temperature_process(data, bg_time_init, bg_time_end, tg_time_init, tg_time_end, step_size=step_size, thres_sd_heat=thres_sd_heat, save_svg=save_svg, show_graph=show_graph, model=model)
         print("[!] process has done")
         exit(0)
     elif args.target == "min_temperature":
-        raise
+        print("[#] Make Min temperature Grpah")
+        temperature_process(data, bg_time_init, bg_time_end, tg_time_init, tg_time_end, step_size=step_size, thres_sd_heat=thres_sd_heat, save_svg=save_svg, show_graph=show_graph, svg_filepath="min_temperature.svg", model=model, column=MIN_TEMPERATURE)
+        print("[!] process has done")
+        exit(0)
     elif args.target == "cor":
         print("[#] Make Cor Graph")
-        cor_process(data ,bg_time_init, bg_time_end, tg_time_init, tg_time_end, step_size=step_size, save_svg=save_svg, show_graph=show_graph)
+        cor_process(data ,bg_time_init, bg_time_end, tg_time_init, tg_time_end, step_size=step_size, ERROR_STEP=error_step_size, SD_NUM=sd_num, save_svg=save_svg, show_graph=show_graph, multi_thread=args.multi_thread, max_workers=args.workers, bootstrap=args.bootstrap, model=model)
         print("[!] process has done")
     elif args.target == "all":
         print("[#] Make all graph")
-        all_graph(data, bg_time_init, bg_time_end, tg_time_init, tg_time_end, save_svg=save_svg, show_graph=show_graph)
+        all_graph(data, bg_time_init, bg_time_end, tg_time_init, tg_time_end, save_svg=save_svg, show_graph=show_graph, multi_thread=args.multi_thread, max_workers=args.workers, model=model)
+        print("[!] process has done")
+    elif args.target == "sweep":
+        print("[#] Sweep parameters")
+        result = parameter_sweep(data, bg_time_init, bg_time_end, tg_time_init, tg_time_end, step_size=step_sizes, thres_sd_heat=thres_sd_heats, welch_thres=welch_thress, sd_num=sd_nums, error_step=error_step_sizes, multi_thread=args.multi_thread, max_workers=args.workers)
+        result.save_csv(args.sweep_output)
         print("[!] process has done")
     elif args.target == "debug":
         debug(data)
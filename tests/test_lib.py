@@ -0,0 +1,777 @@
+#!/usr/bin/env python3
+#encoding: utf-8
+import os
+import datetime
+import itertools
+import io
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+from lib import *
+from lib import bootstrap, scan, slope
+
+
+def random_points(rng, n, decimals=None, ties=False):
+    x = rng.normal(0, 2, n)
+    # half of the cases lie around slope -1, where the shift of
+    # passing_bablock is counted
+    y = (-x if ties else 0.5*x) + rng.normal(0, 1, n)
+    if decimals is not None:
+        x = np.round(x, decimals)
+        y = np.round(y, decimals)
+    return x, y
+
+
+def pair_slopes(x, y):
+    return np.array([(y[j]-y[i]) / (x[j]-x[i]) for i, j in itertools.combinations(range(x.size), 2) if x[i] != x[j]])
+
+
+def fit_or_none(fn, *args, **kwargs):
+    try:
+        return fn(*args, **kwargs)
+    except IndexError:
+        # too few points for the confidence ranks
+        return None
+
+
+# DataBuilder
+
+def test_data_builder_append():
+    rows = [[datetime.datetime(2020, 1, 1, 0, i), i * 0.5, "a%d" % i] for i in range(5)]
+    builder = Data.builder([TIME, MAX_TEMPERATURE, "name"], capacity=2)
+    for row in rows:
+        builder.append(row)
+    assert builder.capacity >= 5
+    assert builder.last(MAX_TEMPERATURE) == 2.0
+    df = builder.build().inner_data
+    assert list(df.columns) == [TIME, MAX_TEMPERATURE, "name"]
+    assert df[TIME].dtype == np.dtype("datetime64[ns]")
+    assert df.equals(pd.DataFrame(rows, columns=[TIME, MAX_TEMPERATURE, "name"]).astype({TIME: "datetime64[ns]"}))
+
+
+def test_data_builder_append_without_labels():
+    builder = Data.builder()
+    with pytest.raises(ValueError):
+        builder.append([datetime.datetime(2020, 1, 1), 1.5])
+    with pytest.raises(ValueError):
+        Data.builder([TIME]).append([datetime.datetime(2020, 1, 1), 1.5])
+
+
+def test_data_builder_extend():
+    rng = np.random.default_rng(1)
+    frames = [pd.DataFrame({TIME: pd.date_range("2020-01-01", periods=n, freq="min"), DISTANCE: rng.uniform(size=n).astype(np.float32)}) for n in (3, 0, 7, 40)]
+    builder = Data.builder(capacity=4)
+    assert builder.build().isempty()
+    for df in frames:
+        builder.extend(Data(df))
+    df = builder.build().inner_data
+    expected = pd.concat(frames, ignore_index=True)
+    assert builder.capacity >= len(expected)
+    assert df[DISTANCE].dtype == np.float32
+    assert df.equals(expected)
+
+
+# calc_features
+
+def track(rng, n):
+    time = pd.date_range("2020-01-01", periods=n, freq="3s").to_numpy().copy()
+    time[5] = time[4]
+    return pd.DataFrame({
+        TIME: time,
+        MAX_POS_X: rng.integers(0, 80, n).astype(np.int16),
+        MAX_POS_Y: rng.integers(0, 60, n).astype(np.int16),
+    })
+
+
+def test_calc_features():
+    # distance as the pandas shift of the old calc_distance, the rest from it
+    df = track(np.random.default_rng(4), 200)
+    x = df[MAX_POS_X].astype(np.float64)
+    y = df[MAX_POS_Y].astype(np.float64)
+    distance = ((x - x.shift(1, fill_value=x[0]))**2 + (y - y.shift(1, fill_value=y[0]))**2)**0.5
+    dt = df[TIME].diff().dt.total_seconds().fillna(0).to_numpy()
+
+    features = calc_features(Data(df.copy())).inner_data
+    assert np.allclose(features[DISTANCE], distance)
+    assert np.allclose(features[SPEED], np.where(dt > 0, distance / np.where(dt > 0, dt, 1), 0))
+    assert np.allclose(features[PATH_LENGTH], distance.cumsum())
+    assert np.array_equal(features[IMMOBILE], distance <= IMMOBILE_THRES)
+    moved = distance.to_numpy() > 0
+    heading = np.arctan2((y - y.shift(1)).to_numpy(), (x - x.shift(1)).to_numpy())
+    assert np.allclose(features[HEADING][moved], heading[moved])
+    assert features[HEADING][~moved].isna().all()
+    for name, dtype in FEATURES_DTYPE.items():
+        assert features[name].dtype == dtype
+
+
+def test_iter_calc_features():
+    # chunks give the same features as the whole frame
+    df = track(np.random.default_rng(5), 200)
+    expected = calc_features(Data(df.copy())).inner_data
+    chunks = [Data(df.iloc[i:j].copy()) for i, j in [(0, 1), (1, 1), (1, 64), (64, 150), (150, 200)]]
+    result = pd.concat([d.inner_data for d in iter_calc_features(chunks)])
+    assert result.equals(expected)
+
+
+# Data.time_slice
+
+def test_time_slice():
+    # same rows, in the same order, as the query of timerange_to_query
+    rng = np.random.default_rng(3)
+    time = pd.date_range("2020-01-01", periods=500, freq="min")
+    frame = pd.DataFrame({TIME: time, DISTANCE: rng.uniform(size=time.size)})
+    shuffled = frame.iloc[rng.permutation(time.size)]
+    bounds = [
+        (datetime.datetime(2020, 1, 1, 1), datetime.datetime(2020, 1, 1, 3, 30)),
+        (datetime.datetime(2019, 12, 31), datetime.datetime(2020, 1, 2)),
+        (datetime.datetime(2020, 1, 1, 2, 0, 30), datetime.datetime(2020, 1, 1, 2, 1)),
+        (datetime.datetime(2020, 1, 2), datetime.datetime(2020, 1, 3)),
+    ]
+    for df in (frame, shuffled):
+        data = Data(df)
+        for start, end in bounds:
+            expected = data.query(timerange_to_query(start, end)).inner_data
+            assert data.time_slice(start, end).inner_data.equals(expected)
+
+
+# Cache
+
+def cached_recording(tmp_path, name, rows=10):
+    filename = tmp_path / name
+    filename.write_text("".join(a3_line(i) for i in range(rows)))
+    return str(filename)
+
+
+def test_cache_hit_and_invalidation(tmp_path, monkeypatch):
+    cache = Cache(str(tmp_path / "cache"))
+    filename = cached_recording(tmp_path, "a3.csv")
+    assert cache.get(filename, "a3") is None
+    df = Loader(filename, format="a3").load().inner_data
+    cache.put(filename, "a3", df)
+    assert cache.get(filename, "a3").equals(df)
+    assert cache.get(filename, "lepton") is None
+
+    # a new cache version misses
+    monkeypatch.setattr("lib.cache.CACHE_VERSION", CACHE_VERSION + 1)
+    assert cache.get(filename, "a3") is None
+    monkeypatch.undo()
+
+    # so does a changed mtime or size of the recording
+    st = os.stat(filename)
+    os.utime(filename, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert cache.get(filename, "a3") is None
+    cache.put(filename, "a3", df)
+    with open(filename, "a") as f:
+        f.write(a3_line(10))
+    assert cache.get(filename, "a3") is None
+
+
+def test_cache_invalidate(tmp_path):
+    cache = Cache(str(tmp_path / "cache"))
+    first = cached_recording(tmp_path, "first.csv")
+    second = cached_recording(tmp_path, "second.csv")
+    for filename in (first, second):
+        cache.put(filename, "a3", Loader(filename, format="a3").load().inner_data)
+    cache.invalidate(first)
+    assert cache.get(first, "a3") is None
+    assert cache.get(second, "a3") is not None
+    cache.clear()
+    assert cache.get(second, "a3") is None
+    assert cache.size() == 0
+
+
+def test_cache_evict(tmp_path):
+    cache = Cache(str(tmp_path / "cache"))
+    filenames = [cached_recording(tmp_path, "%d.csv" % i) for i in range(3)]
+    df = Loader(filenames[0], format="a3").load().inner_data
+    cache.put(filenames[0], "a3", df)
+    entry_size = cache.size()
+    # room for two entries, the least recently used one goes first
+    cache.max_size = 2*entry_size
+    cache.put(filenames[1], "a3", df)
+    for i, (_, _, path, _) in enumerate(sorted(cache.entries(), key=lambda e: e[3]["filename"])):
+        os.utime(os.path.join(path, META_FILE), (i, i))
+    cache.get(filenames[0], "a3")
+    cache.put(filenames[2], "a3", df)
+    assert cache.size() <= cache.max_size
+    assert cache.get(filenames[0], "a3") is not None
+    assert cache.get(filenames[1], "a3") is None
+    assert cache.get(filenames[2], "a3") is not None
+
+
+# load_directory
+
+def test_load_directory(tmp_path):
+    # files named out of time order, overlapping by two rows, one empty
+    lines = [a3_line(i) for i in range(30)]
+    (tmp_path / "b.csv").write_text("".join(lines[:12]))
+    (tmp_path / "a.csv").write_text("".join(lines[10:30]))
+    (tmp_path / "c.csv").write_text("")
+    (tmp_path / "notes.txt").write_text(lines[0])
+    (tmp_path / "all.txt").write_text("".join(lines))
+
+    data = load_directory(str(tmp_path), max_workers=2)
+    expected = Loader(str(tmp_path / "all.txt"), format="a3").load()
+    assert data.inner_data.equals(expected.inner_data)
+
+    # an executor of the caller is used as it is
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        data = load_directory(str(tmp_path), executor=executor)
+    assert data.inner_data.equals(expected.inner_data)
+
+    with pytest.raises(FileNotFoundError):
+        load_directory(str(tmp_path / "missing"))
+
+
+# Loader.follow
+
+def a3_line(i):
+    time = datetime.datetime(2020, 1, 1) + datetime.timedelta(minutes=i)
+    return "%s,%.2f,%d,%d,%.2f,%d,%d\n" % (time.strftime(A3_TIME_FORMAT), 30 + i*0.1, i, 2*i, 20 + i*0.1, i, i)
+
+
+def followed_times(loader):
+    return [t.minute for t in loader.follow().get_col(TIME)]
+
+
+def test_loader_follow(tmp_path):
+    filename = tmp_path / "a3.csv"
+    lines = [a3_line(i) for i in range(6)]
+    filename.write_text("".join(lines[:3]) + lines[3][:10])
+    loader = Loader(str(filename), format="a3")
+    assert followed_times(loader) == [0, 1, 2]
+    assert followed_times(loader) == [0, 1, 2]
+
+    with open(filename, "a") as f:
+        f.write(lines[3][10:] + lines[4])
+    data = loader.follow()
+    assert [t.minute for t in data.get_col(TIME)] == [0, 1, 2, 3, 4]
+    assert np.allclose(data.get_col(DISTANCE), [0] + [5**0.5]*4)
+    assert np.allclose(data.get_col(PATH_LENGTH), np.arange(5) * 5**0.5)
+
+    # truncated: read again from the start
+    filename.write_text(lines[0] + lines[5])
+    assert followed_times(loader) == [0, 5]
+
+    # rotated: a new file under the same name
+    rotated = tmp_path / "rotated.csv"
+    rotated.write_text("".join(lines[:4]))
+    os.replace(rotated, filename)
+    assert followed_times(loader) == [0, 1, 2, 3]
+
+
+# Loader.iter_load
+
+@pytest.mark.parametrize("chunksize", [1, 7, 50, 1000])
+def test_iter_load(tmp_path, chunksize):
+    filename = tmp_path / "a3.csv"
+    filename.write_text("".join(a3_line(i) for i in range(203)))
+    loader = Loader(str(filename), format="a3")
+    expected = loader.load().inner_data
+    chunks = list(loader.iter_load(chunksize=chunksize))
+    assert len(chunks) == -(-203 // chunksize)
+    assert pd.concat([d.inner_data for d in chunks]).equals(expected)
+
+    # windows of 8 rows span the chunk boundaries, the last one is short
+    features = calc_features(Data(expected.copy()))
+    windows = pd.concat([d.inner_data for d in iter_window_process(iter_calc_features(chunks), 8)], ignore_index=True)
+    assert windows.equals(window_process(features, 8).inner_data)
+
+
+# welch_ttest
+
+def summary(values):
+    values = np.asarray(values, dtype=np.float64)
+    var = values.var(ddof=1) if values.size > 1 else np.nan
+    return values.mean(), var, values.size
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+def test_welch_ttest():
+    rng = np.random.default_rng(2)
+    groups = [
+        (rng.normal(0, 1, 20), rng.normal(0.5, 2, 35)),
+        (rng.normal(0, 1, 3), rng.normal(0, 1, 2)),
+        ([1.0], [1.0, 2.0, 3.0]),
+        ([2.0, 2.0, 2.0], [2.0, 2.0, 2.0, 2.0]),
+        ([2.0, 2.0, 2.0], [3.0, 3.0, 3.0, 3.0]),
+        ([2.0, 2.0, 2.0], [3.0, 3.5, 2.5, 3.0]),
+    ]
+    first = [summary(a) for a, _ in groups]
+    second = [summary(b) for _, b in groups]
+    p_value = welch_ttest(*np.array(first).T, *np.array(second).T)
+    expected = [stats.ttest_ind(a, b, equal_var=False).pvalue for a, b in groups]
+    assert np.isnan(p_value[2]) and np.isnan(p_value[3])
+    assert np.allclose(p_value, expected, equal_nan=True)
+
+
+# passing_bablock
+
+def test_count_slopes_rounded_bound():
+    x = np.array([-1.5, -0.3])
+    y = np.array([3.8, 2.5999999999999996])
+    assert (y[1]-y[0]) / (x[1]-x[0]) < -1
+    assert slope.count_slopes(x, y, hi=-1) == 1
+    assert slope.count_slopes(x, y, lo=-1) == 0
+
+
+@pytest.mark.parametrize("decimals", [None, 1, 0])
+def test_count_slopes(decimals):
+    rng = np.random.default_rng(decimals or 5)
+    for k in range(40):
+        x, y = random_points(rng, rng.integers(2, 60), decimals, ties=k % 2)
+        slopes = pair_slopes(x, y)
+        bounds = [-np.inf, -1.0, 0.5, np.inf] + list(slopes[:3])
+        for lo, hi in itertools.combinations(sorted(bounds), 2):
+            assert slope.count_slopes(x, y, lo, hi) == ((lo < slopes) & (slopes < hi)).sum()
+            between = np.sort(slope.slopes_between(x, y, lo, hi))
+            assert np.array_equal(between, np.sort(slopes[(lo < slopes) & (slopes <= hi)]))
+
+
+@pytest.mark.parametrize("decimals", [None, 1])
+def test_passing_bablock(decimals):
+    rng = np.random.default_rng(11)
+    for k in range(150):
+        x, y = random_points(rng, rng.integers(20, 80), decimals, ties=k % 2)
+        expected = fit_or_none(passing_bablock_exact, x, y)
+        result = fit_or_none(passing_bablock, x, y)
+        if expected is None:
+            assert result is None
+        else:
+            assert np.allclose(result, expected)
+
+
+def test_passing_bablock_multi_thread():
+    rng = np.random.default_rng(12)
+    for k in range(4):
+        x, y = random_points(rng, 60, 1, ties=k % 2)
+        assert np.allclose(passing_bablock(x, y, multi_thread=True, max_workers=2), passing_bablock_exact(x, y))
+
+
+def test_parallel_select_slopes():
+    rng = np.random.default_rng(13)
+    x, y = random_points(rng, 150, 1, ties=True)
+    slopes = np.sort(pair_slopes(x, y))
+    seen = {}
+
+    def ranks(below, total):
+        seen["below"] = below
+        seen["total"] = total
+        return [0, below, total // 2, total - 1]
+
+    selected = parallel_select_slopes(x, y, ranks, bound=-1.0, max_workers=2, tile_size=16, rng=rng)
+    assert seen == {"below": (slopes < -1).sum(), "total": slopes.size}
+    assert selected == [slopes[0], slopes[seen["below"]], slopes[slopes.size // 2], slopes[-1]]
+
+
+def test_passing_bablock_drops_non_finite():
+    rng = np.random.default_rng(14)
+    x, y = random_points(rng, 40)
+    expected = passing_bablock_exact(x, y)
+    x_inf = np.concatenate([x, [-np.inf, 1.0]])
+    y_inf = np.concatenate([y, [1.0, np.nan]])
+    assert np.allclose(passing_bablock(x_inf, y_inf), expected)
+
+
+def test_fit_cor_zero_distance_window():
+    # an idle bg window has log2 distance -inf and must not reach the band
+    rng = np.random.default_rng(15)
+    distance, temperature = random_points(rng, 40, 1)
+    distance = 2**distance
+    window = Data(pd.DataFrame({DISTANCE_MEAN: distance, MAX_TEMPERATURE_MEAN: temperature}))
+    idle = Data(pd.DataFrame({DISTANCE_MEAN: np.append(distance, 0.0), MAX_TEMPERATURE_MEAN: np.append(temperature, 30.0)}))
+    expected = BaselineModel()
+    expected.fit_cor(window)
+    model = BaselineModel()
+    model.fit_cor(idle)
+    assert np.isfinite(model.cor["side_std"])
+    assert np.all(np.isfinite(model.band()))
+    assert np.allclose(model.band(), expected.band())
+    assert np.array_equal(model.cor["distance"], expected.cor["distance"])
+
+    tg_distance = np.log2(distance[:5])
+    excess = model.cor_excess(tg_distance, tg_distance*model.cor["slope"] + model.cor["n"] + 10)
+    assert (cor_error_value(excess, 1) > 0).all()
+
+
+# error_scan
+
+def temperature_loop(error, thres_sd_heat):
+    value = 0
+    values = []
+    for e in error:
+        if e > thres_sd_heat:
+            value += (e / thres_sd_heat) * 0.1
+        else:
+            value -= 0.5
+            if value < 0:
+                value = 0
+        values.append(value)
+    return np.array(values)
+
+
+def distance_loop(p_value, welch_thres):
+    value = 0
+    values = []
+    for p in p_value:
+        if p < welch_thres:
+            with np.errstate(divide="ignore"):
+                value += -0.1 * (np.log10(p))
+        else:
+            value -= 1.0
+            if value < 0:
+                value = 0
+        values.append(value)
+    return np.array(values)
+
+
+def cor_loop(excess, error_step):
+    value = 0
+    ex_time = 0
+    values = []
+    for e in excess:
+        if e > 0:
+            value += e
+            ex_time = 0
+        elif ex_time > error_step:
+            value = 0
+            ex_time = 0
+        else:
+            ex_time += 1
+        values.append(value)
+    return np.array(values)
+
+
+@pytest.fixture(params=[None, 7])
+def scan_block(request, monkeypatch):
+    # small blocks carry the value across many block edges
+    if request.param is not None:
+        monkeypatch.setattr(scan, "SCAN_BLOCK", request.param)
+    return request.param
+
+
+def test_temperature_error_value(scan_block):
+    rng = np.random.default_rng(21)
+    for thres in (0.5, 1.5, 3.0):
+        error = rng.normal(1, 1.5, 300)
+        error[rng.integers(0, error.size, 10)] = np.nan
+        assert np.allclose(temperature_error_value(error, thres), temperature_loop(error, thres))
+
+
+def test_distance_error_value(scan_block):
+    rng = np.random.default_rng(22)
+    for thres in (0.05, 0.5):
+        p_value = rng.uniform(0, 1, 300)**3
+        p_value[rng.integers(0, p_value.size, 10)] = np.nan
+        p_value[200] = 0.0
+        assert np.allclose(distance_error_value(p_value, thres), distance_loop(p_value, thres), equal_nan=True)
+
+
+def test_cor_error_value(scan_block):
+    rng = np.random.default_rng(23)
+    for error_step in (0, 1, 2.5, 5):
+        excess = np.where(rng.uniform(size=300) < 0.3, rng.uniform(0, 1, 300), 0.0)
+        assert np.allclose(cor_error_value(excess, error_step), cor_loop(excess, error_step))
+
+
+def test_error_scan_batch(scan_block):
+    rng = np.random.default_rng(24)
+    hit = rng.uniform(size=(4, 200)) < 0.3
+    increment = rng.uniform(0, 1, (4, 200))
+    reset_after = np.array([0, 1, 3, 10])
+    initial = np.array([0.0, 1.0, 2.0, 0.5])
+    batch = error_scan(hit, increment, reset_after=reset_after, initial=initial, method="numpy")
+    for r in range(4):
+        row = error_scan(hit[r], increment[r], reset_after=reset_after[r], initial=initial[r], method="numpy")
+        assert np.allclose(batch[r], row)
+    loop = scan._scan_loop(hit, increment, np.zeros(hit.shape), -np.inf, scan._reset_points(hit, reset_after.astype(np.float64)), initial)
+    assert np.allclose(batch, loop)
+
+
+# cor_bootstrap
+
+def test_cor_bootstrap_unit_weights():
+    # a replicate taking every window once is the fit of cor_process
+    rng = np.random.default_rng(31)
+    x, y = random_points(rng, 80, 1)
+    model = BaselineModel()
+    slope_, sec, upper, lower = passing_bablock_exact(x, y)
+    residual = (y - (x*slope_ + sec)) / (1+slope_**2)**0.5
+    model.cor = {"slope": slope_, "n": sec, "side_std": residual.std(ddof=1)}
+    n_plus, n_minus = model.band(SD_NUM)
+
+    slopes, i, j = bootstrap._pairs(x, y, bootstrap.BOOTSTRAP_MAX_PAIRS, rng)
+    bootstrap._boot_init(x, y, slopes, i, j, SD_NUM)
+    fit = bootstrap._boot_fit(np.ones((1, x.size), dtype=np.int64))[0]
+    assert np.allclose(fit, [slope_, sec, n_plus, n_minus])
+
+
+def test_cor_bootstrap_bands():
+    rng = np.random.default_rng(32)
+    x, y = random_points(rng, 80, 1)
+    slope_, sec, _, _ = passing_bablock_exact(x, y)
+    bands = cor_bootstrap(x, y, n_boot=200, max_workers=2, seed=1)
+    assert bands["replicates"].shape == (200, 4)
+    assert bands["slope"][0] <= slope_ <= bands["slope"][1]
+    assert bands["n"][0] <= sec <= bands["n"][1]
+    again = cor_bootstrap(x, y, n_boot=200, max_workers=2, seed=1)
+    assert np.array_equal(bands["replicates"], again["replicates"])
+
+
+@pytest.mark.parametrize("ties", [False, True])
+def test_cor_bootstrap_window(monkeypatch, ties):
+    # replicates whose median falls outside a narrow window get the slope
+    # of the full weighted median
+    rng = np.random.default_rng(33)
+    x, y = random_points(rng, 300, 1, ties)
+    slopes, i, j = bootstrap._pairs(x, y, bootstrap.BOOTSTRAP_MAX_PAIRS, rng)
+    bootstrap._boot_init(x, y, slopes, i, j, SD_NUM)
+    w = rng.multinomial(x.size, np.full(x.size, 1/x.size), size=50)
+    wide = bootstrap._boot_fit(w)
+    monkeypatch.setattr("lib.bootstrap.BOOTSTRAP_WINDOW", 0.01)
+    monkeypatch.setattr("lib.bootstrap.BOOTSTRAP_CHUNK_CELLS", 1000)
+    assert np.array_equal(bootstrap._boot_fit(w), wide)
+
+    monkeypatch.setattr("lib.bootstrap.BOOTSTRAP_WINDOW", 10**6)
+    assert np.array_equal(bootstrap._boot_fit(w), wide)
+
+
+@pytest.mark.parametrize("max_pairs", [bootstrap.BOOTSTRAP_MAX_PAIRS, 500])
+def test_cor_bootstrap_ties(max_pairs):
+    # on tied data, and on a subset of the pairs, the bands cover the
+    # slope of the data
+    rng = np.random.default_rng(34)
+    x, y = random_points(rng, 200, 0, True)
+    slope_, sec, _, _ = passing_bablock_exact(x, y)
+    bands = cor_bootstrap(x, y, n_boot=200, max_workers=2, seed=2, max_pairs=max_pairs)
+    assert bands["slope"][0] <= slope_ <= bands["slope"][1]
+    assert bands["n"][0] <= sec <= bands["n"][1]
+
+
+# decimate
+
+def bucket_extremes(x, y, buckets):
+    bucket = ((x - x[0]) / (x[-1] - x[0]) * buckets).astype(np.int64).clip(0, buckets - 1)
+    return {b: (y[bucket == b].min(), y[bucket == b].max()) for b in np.unique(bucket)}
+
+
+def test_decimate():
+    rng = np.random.default_rng(51)
+    x = np.sort(rng.uniform(0, 1000, 100000))
+    y = np.cumsum(rng.normal(0, 1, x.size))
+    y[rng.integers(0, x.size, 20)] += 500
+    dx, dy = decimate(x, y, buckets=100)
+    assert dx.size < x.size // 10
+    assert (dx[0], dy[0], dx[-1], dy[-1]) == (x[0], y[0], x[-1], y[-1])
+    assert bucket_extremes(dx, dy, 100) == bucket_extremes(x, y, 100)
+
+    # unsorted x is drawn in x order
+    order = rng.permutation(x.size)
+    ux, uy = decimate(x[order], y[order], buckets=100)
+    assert np.array_equal(ux, dx) and np.array_equal(uy, dy)
+
+
+def test_min_max_pyramid():
+    rng = np.random.default_rng(52)
+    x = np.arange(200000, dtype=np.float64)
+    y = np.cumsum(rng.normal(0, 1, x.size))
+    order = rng.permutation(x.size)
+    pyramid = MinMaxPyramid(x[order], y[order])
+
+    # the full view keeps the ends and the extremes, indexing the input order
+    index = pyramid.query(buckets=100)
+    assert index.size < x.size // 10
+    drawn = order[index]
+    assert drawn.min() == 0 and drawn.max() == x.size - 1
+    assert y[drawn].min() == y.min() and y[drawn].max() == y.max()
+
+    # a zoomed view runs one sample past each edge
+    drawn = set(order[pyramid.query(1000.5, 150000.5, buckets=100)])
+    assert {1000, 150001} <= drawn
+
+    # and a narrow one draws every sample
+    assert np.array_equal(np.sort(order[pyramid.query(5000, 5100, buckets=100)]), np.arange(4999, 5102))
+
+
+def test_min_max_pyramid_zoomed_extremes():
+    # spikes next to the edges of a zoomed view stay in the plot
+    rng = np.random.default_rng(53)
+    x = np.arange(100000, dtype=np.float64)
+    y = np.cumsum(rng.normal(0, 1, x.size))
+    y[rng.integers(0, x.size, 500)] += rng.choice([-300, 300], 500)
+    y[rng.integers(0, x.size, 50)] = np.nan
+    for _ in range(200):
+        i0, i1 = np.sort(rng.integers(0, x.size, 2))
+        if i1 - i0 <= 400:
+            continue
+        # the extreme of the view at offset 1 from its start, the extreme of
+        # its block just outside
+        spiked = y.copy()
+        spiked[max(i0 - 1, 0)] = np.nanmax(y) + 2
+        spiked[i0 + 1] = np.nanmax(y) + 1
+        for values in (y, spiked):
+            pyramid = MinMaxPyramid(x, values)
+            index = pyramid.query(x[i0] + 0.5, x[i1 - 1] - 0.5, buckets=100)
+            drawn = values[index]
+            assert np.nanmin(drawn) == np.nanmin(values[i0:i1])
+            assert np.nanmax(drawn) == np.nanmax(values[i0:i1])
+
+
+# parameter_sweep
+
+BG_INIT = datetime.datetime(2019, 6, 26)
+BG_END = datetime.datetime(2019, 7, 1)
+TG_INIT = datetime.datetime(2019, 7, 1)
+TG_END = datetime.datetime(2019, 7, 4)
+
+
+@pytest.fixture(scope="module")
+def recording(tmp_path_factory):
+    # 8 days sampled every 3 minutes, a3 csv
+    rng = np.random.default_rng(41)
+    time = pd.date_range(BG_INIT, periods=8*24*20, freq="3min")
+    day = np.sin(2*np.pi*time.hour.to_numpy() / 24)
+    frame = pd.DataFrame({
+        TIME: time.strftime(A3_TIME_FORMAT),
+        MAX_TEMPERATURE: np.round(30 + day + rng.normal(0, 0.5, time.size), 2),
+        MAX_POS_X: rng.integers(0, 80, time.size),
+        MAX_POS_Y: rng.integers(0, 60, time.size),
+        MIN_TEMPERATURE: np.round(20 + day + rng.normal(0, 0.5, time.size), 2),
+        MIN_POS_X: rng.integers(0, 80, time.size),
+        MIN_POS_Y: rng.integers(0, 60, time.size),
+    })
+    filename = tmp_path_factory.mktemp("recording") / "a3.csv"
+    frame.to_csv(filename, header=False, index=False)
+    return load_data(str(filename))
+
+
+def test_parameter_sweep(recording):
+    # every cell of the sweep is the series of the single run
+    args = (recording, BG_INIT, BG_END, TG_INIT, TG_END)
+    with contextlib.redirect_stdout(io.StringIO()):
+        sweep = parameter_sweep(*args, step_size=(8, 4), thres_sd_heat=(1.0, 2.0), welch_thres=(0.1, 0.5), error_step=(1, 2)).inner_data
+        for size in (8, 4):
+            at = sweep[sweep.step_size == size]
+            for thres in (1.0, 2.0):
+                for column in TEMPERATURE_COLUMNS:
+                    error_data, _ = temperature_process(*args, step_size=size, thres_sd_heat=thres, column=column)
+                    row = at[(at[TARGET] == column) & (at.thres_sd_heat == thres)]
+                    assert np.array_equal(row[TIME].to_numpy(), error_data.get_col(TIME).to_numpy())
+                    assert np.allclose(row[ERROR_VALUE], error_data.get_col(TEMPERATURE_ERROR_DATA))
+            for thres in (0.1, 0.5):
+                error_data, _ = distance_process(*args, step_size=size, welch_thres=thres, save_svg=False)
+                row = at[(at[TARGET] == "distance") & (at.welch_thres == thres)]
+                assert np.allclose(row[ERROR_VALUE], error_data.get_col(ERROR_VALUE), equal_nan=True)
+            for step in (1, 2):
+                error_data, _ = cor_process(*args, step_size=size, ERROR_STEP=step)
+                row = at[(at[TARGET] == "cor") & (at.error_step == step)]
+                assert np.allclose(row[ERROR_VALUE], error_data.get_col(COR_ERROR_VALUE))
+
+
+def test_parameter_sweep_targets(recording):
+    args = (recording, BG_INIT, BG_END, TG_INIT, TG_END)
+    targets = ["distance"]
+    sweep = parameter_sweep(*args, targets=targets).inner_data
+    assert set(sweep[TARGET]) == {"distance"}
+    assert targets == ["distance"]
+    assert BaselineModel.PARTS == ["temperature", "distance", "cor"]
+
+
+def test_process_model_sizes(recording):
+    args = (recording, BG_INIT, BG_END, TG_INIT, TG_END)
+    model = BaselineModel.fit(recording, BG_INIT, BG_END, step_size=4, window_size=4)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for process in (temperature_process, cor_process):
+            process(*args, model=model)
+            process(*args, step_size=4, model=model)
+            with pytest.raises(ValueError):
+                process(*args, step_size=8, model=model)
+        distance_process(*args, model=model, save_svg=False)
+        with pytest.raises(ValueError):
+            distance_process(*args, step_size=8, model=model, save_svg=False)
+
+
+def test_cor_process_windows_once(recording, monkeypatch):
+    args = (recording, BG_INIT, BG_END, TG_INIT, TG_END)
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected, _ = cor_process(*args, model=BaselineModel.fit(recording, BG_INIT, BG_END, parts=["cor"]))
+        calls = []
+        monkeypatch.setattr("lib.lib.window_process", lambda *a, **k: calls.append(a) or window_process(*a, **k))
+        error_data, _ = cor_process(*args)
+    assert len(calls) == 1
+    assert error_data.inner_data.equals(expected.inner_data)
+
+
+def test_score_columns(recording):
+    args = (recording, BG_INIT, BG_END, TG_INIT, TG_END)
+    model = BaselineModel.fit(recording, BG_INIT, BG_END)
+    with contextlib.redirect_stdout(io.StringIO()):
+        scores = model.score(recording, TG_INIT, TG_END)
+        assert sorted(scores) == sorted(TEMPERATURE_COLUMNS + ["distance", "cor"])
+
+        max_only = BaselineModel(BG_INIT, BG_END)
+        max_only.fit_profile(recording.time_slice(BG_INIT, BG_END), [MAX_TEMPERATURE])
+        assert list(max_only.score(recording, TG_INIT, TG_END)) == [MAX_TEMPERATURE]
+        temperature_process(*args, model=max_only)
+        with pytest.raises(ValueError):
+            temperature_process(*args, model=max_only, column=MIN_TEMPERATURE)
+
+
+@pytest.mark.filterwarnings("error::RuntimeWarning")
+def test_temperature_errors_flat_bucket():
+    # a bucket of one row has a nan std, a constant bucket a zero one
+    time = pd.to_datetime(["2020-01-01 00:00", "2020-01-01 00:01", "2020-01-01 00:02", "2020-01-01 01:00"])
+    data = Data(pd.DataFrame({TIME: time, MAX_TEMPERATURE: [30.0, 30.0, 30.0, 31.0]}))
+    model = BaselineModel(step_size=8)
+    model.fit_profile(data, [MAX_TEMPERATURE])
+    error = model.temperature_errors(Data(pd.DataFrame({TIME: time, MAX_TEMPERATURE: [30.0, 30.5, 30.0, 31.0]})), [MAX_TEMPERATURE])[0]
+    assert np.isnan(error[0]) and np.isinf(error[1]) and np.isnan(error[3])
+
+
+def test_process_model_parts(recording):
+    # every process refuses a model without the part it scores
+    args = (recording, BG_INIT, BG_END, TG_INIT, TG_END)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for part, process in [("temperature", temperature_process), ("distance", distance_process), ("cor", cor_process)]:
+            others = [p for p in BaselineModel.PARTS if p != part]
+            model = BaselineModel.fit(recording, BG_INIT, BG_END, parts=others)
+            with pytest.raises(ValueError, match="the model has no"):
+                process(*args, model=model, save_svg=False)
+
+
+def test_model_save_load(recording, tmp_path):
+    model = BaselineModel.fit(recording, BG_INIT, BG_END, step_size=4, window_size=6)
+    filename = str(tmp_path / "model.npz")
+    model.save(filename)
+    loaded = BaselineModel.load(filename)
+    assert (loaded.bg_init_time, loaded.bg_end_time, loaded.step_size, loaded.window_size) == (BG_INIT, BG_END, 4, 6)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = model.score(recording, TG_INIT, TG_END)
+        scores = loaded.score(recording, TG_INIT, TG_END)
+    assert sorted(scores) == sorted(expected)
+    for name, value in expected.items():
+        value = value if isinstance(value, tuple) else (value,)
+        again = scores[name] if isinstance(scores[name], tuple) else (scores[name],)
+        for a, b in zip(value, again):
+            assert a.inner_data.equals(b.inner_data)
+
+
+def test_all_graph(recording):
+    # the concurrent scorers give the series of the single process runs
+    args = (recording, BG_INIT, BG_END, TG_INIT, TG_END)
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = all_graph(*args, save_svg=False, show_graph=False, max_workers=2)
+        plt.close("all")
+        temperature, _ = temperature_process(*args)
+        distance, _ = distance_process(*args, save_svg=False)
+        cor, _ = cor_process(*args)
+    for part, error_data, column in [("temperature", temperature, TEMPERATURE_ERROR_DATA), ("distance", distance, ERROR_VALUE), ("cor", cor, COR_ERROR_VALUE)]:
+        time, value = results[part]
+        assert np.array_equal(time, error_data.get_col(TIME).to_numpy())
+        assert np.allclose(value, error_data.get_col(column), equal_nan=True)